@@ -9,13 +9,30 @@ import time
 import traceback
 import aiohttp
 import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import math
+import mmap
+from array import array
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 from typing import Optional, List, Dict
+import hashlib
+import hmac
 import json
-import requests
+import signal
+import sqlite3
+import sys
+from urllib.parse import urlencode, urlsplit
 
-from flask import Flask
+from aiohttp import web
+from slots import DEFAULT_PAYOUT_TABLE, SlotMachine, load_table
+from pymongo import MongoClient, ReplaceOne
 from telegram import (
+    Bot,
     Update,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
@@ -23,14 +40,18 @@ from telegram import (
     ReplyKeyboardRemove
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from telegram.ext import (
     ApplicationBuilder,
+    BaseRateLimiter,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     ContextTypes,
     filters,
 )
+from telegram.request import HTTPXRequest
 
 # ================== Configuration ==================
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
@@ -39,170 +60,1593 @@ CHANNEL_LINK = "https://t.me/PlayPalu"  # Your channel link
 GROUP_LINK = "https://t.me/playpalg"    # Your group link
 NEWS_API = os.getenv("NEWS_API", "")
 GIPHY_API = os.getenv("GIPHY_API", "")
+NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsapi.org/v2/top-headlines")
+NEWS_COUNTRY = os.getenv("NEWS_COUNTRY", "us")
+GIPHY_API_URL = os.getenv("GIPHY_API_URL", "https://api.giphy.com/v1/gifs/trending")
+FEED_REFRESH_INTERVAL = float(os.getenv("FEED_REFRESH_INTERVAL", "900"))  # seconds between feed ingests
+FEED_TTL = float(os.getenv("FEED_TTL", "3600"))  # stop serving feed items older than this
+MONGO_URI = os.getenv("MONGO_URI", "").strip()
+MONGO_DB = os.getenv("MONGO_DB", "playpal")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "playpal.db")
+STORE_BACKEND = os.getenv("STORE_BACKEND", "").strip().lower()  # mongo, sqlite or memory
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "5"))
+SEND_RATE = float(os.getenv("SEND_RATE", "28"))  # Bot API sends/sec across all chats, below Telegram's ~30/sec cap
+SEND_RATE_PRIVATE = float(os.getenv("SEND_RATE_PRIVATE", "1"))  # sends/sec into one private chat
+SEND_RATE_GROUP = float(os.getenv("SEND_RATE_GROUP", "20"))  # sends/minute into one group or channel
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))  # RetryAfter retries before the error reaches the caller
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+ADMIN_DIGEST_WINDOW = float(os.getenv("ADMIN_DIGEST_WINDOW", "2"))  # seconds to coalesce admin notifications
+MEME_POOL_SIZE = int(os.getenv("MEME_POOL_SIZE", "60"))
+MEME_BATCH_SIZE = int(os.getenv("MEME_BATCH_SIZE", "30"))  # meme-api.com serves at most 50 per call
+MEME_SEEN_TTL = float(os.getenv("MEME_SEEN_TTL", "21600"))  # don't repeat a meme URL for 6 hours
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "5000"))
+USER_SESSION_LIMIT = int(os.getenv("USER_SESSION_LIMIT", "50000"))  # users whose trivia draw order is remembered
+TRIVIA_BANK_PATH = os.getenv("TRIVIA_BANK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "trivia.jsonl"))
+SLOTS_TABLE = os.getenv("SLOTS_TABLE", "")  # JSON payout table, check it with `python slots.py <path>`
+QUIZ_TIMEOUT = float(os.getenv("QUIZ_TIMEOUT", "600"))  # seconds a quiz stays open
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))  # 1 processes updates one at a time
+LAST_SEEN_GRANULARITY = int(os.getenv("LAST_SEEN_GRANULARITY", "300"))  # seconds; last_seen is rounded down to this
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))  # total seconds per outbound request
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "10"))
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))  # consecutive failures before a host is skipped
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "60"))
+
+def parse_weights(raw, defaults):
+    """Parse "meme=2,joke=0.5" style overrides on top of the default weights"""
+    weights = dict(defaults)
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        if name not in weights:
+            print(f"Ignoring unknown weight '{name}'")
+            continue
+        try:
+            weights[name] = max(0.0, float(value))
+        except ValueError:
+            print(f"Ignoring invalid weight '{part}'")
+    if not any(weights.values()):
+        return dict(defaults)
+    return weights
+
+SURPRISE_WEIGHTS = parse_weights(
+    os.getenv("SURPRISE_WEIGHTS", ""),
+    {"fact": 1, "quote": 1, "meme": 1, "joke": 1, "tip": 1},
+)
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN environment variable is required.")
 
-print(f"🤖 Bot starting with Admin IDs: {ADMIN_IDS}")
+PORT = int(os.getenv("PORT", 5000))
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()  # polling (local dev) or webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # public base URL, e.g. https://playpal.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Shared by every instance behind a load balancer, so derive it from the token by default
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")  # or a local Bot API server
+
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise RuntimeError("WEBHOOK_URL environment variable is required in webhook mode.")
+
+# Sharded mode: with SHARD_COUNT > 1 this process only receives updates and
+# hands each one to the worker process owning its user (user_id % SHARD_COUNT),
+# listening on 127.0.0.1:SHARD_BASE_PORT + index. Workers run the bot itself.
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", "1")))
+SHARD_ROLE = os.getenv("SHARD_ROLE", "").strip().lower()  # set to "worker" for the spawned processes
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", str(PORT + 1)))
+# Workers get updates pushed over HTTP like a webhook, just from the front-end
+PUSH_UPDATES = BOT_MODE == "webhook" or SHARD_ROLE == "worker"
+UPDATE_PATH = "/update" if SHARD_ROLE == "worker" else WEBHOOK_PATH
 
-# ================== Flask keep-alive ==================
-app = Flask(__name__)
+# Workers share the regular store but each only loads and pages through its
+# own users, so turning sharding on (or changing SHARD_COUNT) needs no migration
+SHARD_PARTITION = (SHARD_COUNT, SHARD_INDEX) if SHARD_ROLE == "worker" else None
 
-@app.route("/")
-def home():
-    return "✅ PlayPal Ultimate Bot is running!"
+if SHARD_ROLE == "worker":
+    # Telegram's limits are per bot, so the workers split them
+    SEND_RATE /= SHARD_COUNT
+    SEND_RATE_GROUP /= SHARD_COUNT
+
+print(f"🤖 Bot starting with Admin IDs: {ADMIN_IDS}")
 
 # ================== Admin System ==================
 def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
+# ================== Persistent storage ==================
+class MongoUserBackend:
+    """Stores user records in a MongoDB collection keyed by user_id.
+    With a (count, index) partition only users with user_id % count == index
+    are loaded or paged through."""
+    def __init__(self, uri, db_name, partition=None):
+        self.client = MongoClient(uri, tz_aware=True, serverSelectionTimeoutMS=5000)
+        self.users = self.client[db_name]["users"]
+        self.partition = {"$mod": list(partition)} if partition else None
+
+    def _filter(self, **conditions):
+        if self.partition is not None:
+            conditions["_id"] = {**conditions.get("_id", {}), **self.partition}
+        return conditions
+
+    def load_all(self):
+        self.users.create_index("referral_code")
+        for doc in self.users.find(self._filter(), batch_size=1000):
+            doc.pop("_id", None)
+            yield doc
+
+    def find_by_referral_code(self, code):
+        doc = self.users.find_one(self._filter(referral_code=code))
+        if doc:
+            doc.pop("_id", None)
+        return doc
+
+    def save_many(self, records):
+        ops = [ReplaceOne({"_id": r["user_id"]}, {**r, "_id": r["user_id"]}, upsert=True) for r in records]
+        if ops:
+            self.users.bulk_write(ops, ordered=False)
+
+    def page_user_ids(self, after, limit):
+        cursor = self.users.find(self._filter(_id={"$gt": after}), {"_id": 1}).sort("_id", 1).limit(limit)
+        return [doc["_id"] for doc in cursor]
+
+    def load_meta(self, key):
+        doc = self.client[self.users.database.name]["meta"].find_one({"_id": key})
+        return doc["value"] if doc else None
+
+    def save_meta(self, key, value):
+        self.client[self.users.database.name]["meta"].replace_one({"_id": key}, {"_id": key, "value": value}, upsert=True)
+
+    def close(self):
+        self.client.close()
+
+class SQLiteUserBackend:
+    """Local fallback: one JSON document per user in a SQLite file, partitioned
+    like MongoUserBackend"""
+    def __init__(self, path, partition=None):
+        # Shard workers write to the same file, so wait out each other's locks
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS users_referral_code ON users (json_extract(data, '$.referral_code'))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.where, self.params = ("user_id % ? = ?", tuple(partition)) if partition else ("1", ())
+
+    def load_all(self):
+        with self.lock:
+            rows = self.conn.execute(f"SELECT data FROM users WHERE {self.where}", self.params).fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def find_by_referral_code(self, code):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT data FROM users WHERE json_extract(data, '$.referral_code') = ? AND {self.where}",
+                (code, *self.params)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, records):
+        rows = [(r["user_id"], json.dumps(r)) for r in records]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+    def page_user_ids(self, after, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT user_id FROM users WHERE user_id > ? AND {self.where} ORDER BY user_id LIMIT ?",
+                (after, *self.params, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def make_user_backend():
+    if STORE_BACKEND == "memory":
+        return None
+    if STORE_BACKEND == "mongo" or (MONGO_URI and STORE_BACKEND != "sqlite"):
+        return MongoUserBackend(MONGO_URI, MONGO_DB, SHARD_PARTITION)
+    return SQLiteUserBackend(SQLITE_PATH, SHARD_PARTITION)
+
+class UserStore:
+    """Hot in-process cache of user records with batched write-behind flushes.
+
+    Handlers only touch the cache and call mark_dirty(); a background task
+    persists the dirty records every STORE_FLUSH_INTERVAL seconds.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.backend = None
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._meta = {}  # used when running without a backend
+
+    def mark_dirty(self, user_id):
+        if self.backend is not None:
+            self._dirty.add(user_id)
+
+    async def open(self, backend, flush_interval=STORE_FLUSH_INTERVAL):
+        """Warm-load every stored user into the cache and start flushing"""
+        self.backend = backend
+        if backend is None:
+            return
+        records = await asyncio.to_thread(lambda: list(backend.load_all()))
+        for record in records:
+            self._cache_record(record)
+        print(f"💾 Loaded {len(records)} users from {type(backend).__name__}")
+        self._task = asyncio.create_task(self._flush_loop(flush_interval))
+
+    def _cache_record(self, record):
+        record = UserRecord.from_dict(record)
+        self.cache[record.user_id] = record
+        register_user(record)
+        return record
+
+    async def load_by_referral_code(self, code):
+        """Fetch a user created elsewhere (e.g. another dyno) that is not cached yet"""
+        if self.backend is None:
+            return None
+        record = await asyncio.to_thread(self.backend.find_by_referral_code, code)
+        if record is None:
+            return None
+        if record["user_id"] in self.cache:
+            return self.cache[record["user_id"]]
+        return self._cache_record(record)
+
+    async def page_user_ids(self, after, limit):
+        """Return up to `limit` user ids greater than `after`, in ascending order"""
+        if self.backend is None:
+            return heapq.nsmallest(limit, (uid for uid in self.cache if uid > after))
+        return await asyncio.to_thread(self.backend.page_user_ids, after, limit)
+
+    @staticmethod
+    def _meta_key(key):
+        # Shard workers share the store, so each keeps its own checkpoints
+        return f"{key}:shard{SHARD_INDEX}" if SHARD_PARTITION else key
+
+    async def load_meta(self, key):
+        if self.backend is None:
+            return self._meta.get(key)
+        return await asyncio.to_thread(self.backend.load_meta, self._meta_key(key))
+
+    async def save_meta(self, key, value):
+        if self.backend is None:
+            self._meta[key] = value
+            return
+        await asyncio.to_thread(self.backend.save_meta, self._meta_key(key), value)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if self.backend is None or not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            # Snapshot on the event loop so the worker thread never sees a half-updated record
+            batch = [self.cache[uid].to_dict() for uid in dirty if uid in self.cache]
+            try:
+                await asyncio.to_thread(self.backend.save_many, batch)
+            except Exception as e:
+                print(f"Error flushing {len(batch)} users: {e}")
+                self._dirty |= dirty
+                return 0
+            return len(batch)
+
+    async def _flush_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def close(self):
+        """Flush everything that is still dirty; called on shutdown"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.backend is not None:
+            flushed = await self.flush()
+            print(f"💾 Flushed {flushed} users on shutdown")
+            await asyncio.to_thread(self.backend.close)
+            self.backend = None
+
 # ================== In-memory storage ==================
 _users = {}
 _active_games = {}
-_user_sessions = {}
+_user_sessions = OrderedDict()  # LRU, capped at USER_SESSION_LIMIT
+user_store = UserStore(_users)
+
+# ================== Per-user serialization ==================
+class UserLocks:
+    """Keyed locks that keep one user's updates ordered while different users
+    run concurrently. A lock only exists while someone holds or waits for it,
+    so inactive users cost no memory."""
+    def __init__(self):
+        self.locks = {}  # user_id -> [lock, holders + waiters]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id):
+        entry = self.locks.get(user_id)
+        if entry is None:
+            entry = self.locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[user_id]
+
+user_locks = UserLocks()
+
+def per_user(callback):
+    """Run a handler under the sending user's lock (apply at registration, the
+    locks are not re-entrant)"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        user = update.effective_user
+        if user is None:
+            return await callback(update, context)
+        async with user_locks.hold(user.id):
+            return await callback(update, context)
+    return wrapper
+
+# ================== Metrics ==================
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # sorted label items -> value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+class Gauge(Counter):
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # sorted label items -> [per-bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+                break
+        entry[-2] += value
+        entry[-1] += 1
+
+    def samples(self):
+        for key, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", str(bound)),), cumulative
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), entry[-1]
+            yield f"{self.name}_sum", key, entry[-2]
+            yield f"{self.name}_count", key, entry[-1]
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format"""
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _register(self, cls, name, help, **kwargs):
+        metric = cls(f"{self.prefix}_{name}", help, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self._register(Counter, name, help)
+
+    def gauge(self, name, help):
+        return self._register(Gauge, name, help)
+
+    def histogram(self, name, help, **kwargs):
+        return self._register(Histogram, name, help, **kwargs)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {self.TYPES[type(metric)]}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    rendered = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+                    lines.append(f"{name}{{{rendered}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def merge_metrics(sources):
+    """Merge several Prometheus text expositions into one, given as (text, label)
+    pairs where label (e.g. 'shard="0"', or "") is added to every sample. Each
+    family keeps one HELP/TYPE header with all of its samples after it."""
+    families = {}  # family name -> (header lines, sample lines)
+    for text, label in sources:
+        family = families.setdefault("", ([], []))
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = families.setdefault(parts[2], ([], []))
+                    if line not in family[0]:
+                        family[0].append(line)
+                continue
+            if label:
+                name, brace, rest = line.partition("{")
+                if brace:
+                    line = f"{name}{{{label},{rest}"
+                else:
+                    name, value = line.split(None, 1)
+                    line = f"{name}{{{label}}} {value}"
+            family[1].append(line)
+    lines = [line for header, samples in families.values() for line in header + samples]
+    return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry("playpal")
+updates_total = metrics_registry.counter("updates_total", "Updates received, by update type")
+handler_latency = metrics_registry.histogram("handler_latency_seconds", "Handler run time, by handler and entry point")
+handlers_in_flight = metrics_registry.gauge("handlers_in_flight", "Handlers currently running")
+handler_errors = metrics_registry.counter("handler_errors_total", "Exceptions raised by handlers")
+errors_total = metrics_registry.counter("errors_total", "Errors reaching the error handler, by exception type")
+telegram_requests = metrics_registry.counter("telegram_api_requests_total", "Bot API calls, by API method and HTTP status")
+telegram_latency = metrics_registry.histogram("telegram_api_latency_seconds", "Bot API call round-trip time, by API method")
+send_wait = metrics_registry.histogram("send_wait_seconds", "Time Bot API calls waited on the outbound limiter, by priority")
+send_retry_after = metrics_registry.counter("send_retry_after_total", "Flood-control (RetryAfter) responses, by priority and endpoint")
+replies_coalesced = metrics_registry.counter("replies_coalesced_total", "Replies folded into another message of the same update")
+http_fetch_latency = metrics_registry.histogram("http_fetch_seconds", "External content fetches, by host and outcome")
+shard_rpc_latency = metrics_registry.histogram("shard_rpc_seconds", "Calls to other shards, by RPC method and outcome")
+shard_forwarded = metrics_registry.counter("shard_updates_forwarded_total", "Updates the shard front-end handed to workers, by shard and outcome")
+shard_restarts = metrics_registry.counter("shard_restarts_total", "Worker processes restarted by the shard front-end")
+meme_pool_lookups = metrics_registry.counter("meme_pool_lookups_total", "Meme pool pops, by outcome (hit or miss)")
+meme_pool_refills = metrics_registry.counter("meme_pool_refills_total", "Meme batches fetched to refill the pool")
+feed_lookups = metrics_registry.counter("feed_lookups_total", "Reads from the in-memory news/GIF feeds, by feed and outcome")
+feed_refreshes = metrics_registry.counter("feed_refreshes_total", "Background feed refreshes, by feed and outcome")
+broadcast_sends = metrics_registry.counter("broadcast_sends_total", "Broadcast messages, by outcome (delivered, blocked, failed)")
+
+UPDATE_KINDS = ("message", "edited_message", "callback_query", "channel_post", "inline_query", "my_chat_member", "chat_member")
+
+async def count_update(update, context):
+    """Group -1 TypeHandler: sees every update before the real handlers"""
+    kind = next((k for k in UPDATE_KINDS if getattr(update, k, None) is not None), "other")
+    updates_total.inc(type=kind)
+
+@contextlib.asynccontextmanager
+async def track_handler(name, via):
+    handlers_in_flight.inc(handler=name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        handler_errors.inc(handler=name, error=type(e).__name__)
+        raise
+    finally:
+        handler_latency.observe(time.perf_counter() - started, handler=name, via=via)
+        handlers_in_flight.dec(handler=name)
+
+def instrumented(callback, via="command"):
+    """Record latency, in-flight count and errors for a command handler and
+    coalesce its replies (apply at registration)"""
+    buffered = coalesce_replies(callback)
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        async with track_handler(callback.__name__, via):
+            return await buffered(update, context)
+    return wrapper
+
+class InstrumentedRequest(HTTPXRequest):
+    """The bot's HTTP backend, counting and timing every Bot API call"""
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            status = code
+            return code, payload
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, method=api_method)
+            telegram_requests.inc(method=api_method, status=status)
+
+# ================== Stats & Leaderboards ==================
+class Leaderboard:
+    """Top players for one field, kept in a small bounded candidate set.
+
+    Invariant: every member is >= floor and every other user is <= floor, so
+    the top of the candidate set is the global top. A full rebuild is only
+    needed when members drop below the floor and too few candidates remain.
+    """
+    def __init__(self, field, size=10, slack=4):
+        self.field = field
+        self.size = size
+        self.capacity = size * slack
+        self.members = {}  # user_id -> value
+        self.floor = float("-inf")
+
+    def update(self, user_id, value):
+        members = self.members
+        if user_id in members:
+            if value >= self.floor:
+                members[user_id] = value
+                return
+            del members[user_id]
+            if len(members) < self.size:
+                self.rebuild()
+            return
+        if value <= self.floor:
+            return
+        if len(members) < self.capacity:
+            members[user_id] = value
+            return
+        lowest = min(members, key=members.get)
+        if value <= members[lowest]:
+            self.floor = value
+            return
+        self.floor = members.pop(lowest)
+        members[user_id] = value
+
+    def rebuild(self):
+        ranked = heapq.nlargest(
+            self.capacity + 1, ((r[self.field], uid) for uid, r in _users.items())
+        )
+        self.members = {uid: value for value, uid in ranked[:self.capacity]}
+        self.floor = ranked[-1][0] if len(ranked) > self.capacity else float("-inf")
+
+    def top(self, k=None):
+        ranked = sorted(self.members.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k or self.size]
+
+class StatsTracker:
+    """Running totals so /stats never has to scan every user"""
+    def __init__(self):
+        self.total_messages = 0
+        self.total_games = 0
+        self.total_coins = 0
+        self.leaderboards = {field: Leaderboard(field) for field in ("coins", "xp", "referrals")}
+
+    def add_user(self, record):
+        self.total_messages += record["messages"]
+        self.total_games += record["games_played"]
+        self.total_coins += record["coins"]
+        for field, board in self.leaderboards.items():
+            board.update(record["user_id"], record[field])
+
+    def changed(self, record, field):
+        self.leaderboards[field].update(record["user_id"], record[field])
+
+stats = StatsTracker()
+
+class UserRecord:
+    """Compact per-user record. Timestamps are epoch seconds, is_admin and
+    referral_code are derived, and record["field"] access keeps working for
+    handlers written against the old dict records."""
+    FIELDS = (
+        "user_id", "username", "first_name", "is_premium", "messages", "xp",
+        "coins", "level", "language", "joined_at", "last_seen", "games_played",
+        "referrals", "referred_by", "has_joined_channel", "has_joined_group",
+    )
+    # activity_slot is a per-process bitmap index, assigned by ActivityTracker
+    __slots__ = FIELDS + ("activity_slot",)
+    TIMESTAMP_FIELDS = ("joined_at", "last_seen")
+
+    def __init__(self, user_id, username=None, first_name=None):
+        now = int(time.time())
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.is_premium = False
+        self.messages = 0
+        self.xp = 0
+        self.coins = 100  # Starting coins
+        self.level = 1
+        self.language = "en"
+        self.joined_at = now
+        self.last_seen = now
+        self.games_played = 0
+        self.referrals = 0
+        self.referred_by = None
+        self.has_joined_channel = False
+        self.has_joined_group = False
+        self.activity_slot = None
+
+    @property
+    def is_admin(self):
+        return is_admin(self.user_id)
+
+    @property
+    def referral_code(self):
+        return f"ref_{self.user_id}"
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        setattr(self, field, value)
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        # Stored so the backends can index and query on them
+        data["referral_code"] = self.referral_code
+        data["is_admin"] = self.is_admin
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data["user_id"])
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(record, field, data[field])
+        for field in cls.TIMESTAMP_FIELDS:
+            value = getattr(record, field)
+            # Records written before timestamps were ints hold datetimes or ISO strings
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            if isinstance(value, datetime):
+                value = value.replace(tzinfo=value.tzinfo or timezone.utc)
+                setattr(record, field, int(value.timestamp()))
+        return record
+
+class ActivityTracker:
+    """Coarse last_seen updates plus daily/weekly active-user counts.
+
+    last_seen is rounded down to LAST_SEEN_GRANULARITY, so a record only turns
+    dirty when its bucket changes. Every user gets a dense slot number and each
+    day keeps a bitmap with one bit per slot, so DAU/WAU are popcounts.
+    """
+    def __init__(self, granularity, days=7):
+        self.granularity = granularity
+        self.days = days
+        self.next_slot = 0
+        self.bitmaps = {}  # day number -> bytearray
+
+    def assign(self, record):
+        record.activity_slot = self.next_slot
+        self.next_slot += 1
+        # Seed from the stored last_seen so counts survive a restart
+        self._mark(record.activity_slot, record.last_seen // 86400)
+
+    def _mark(self, slot, day):
+        today = int(time.time()) // 86400
+        if day <= today - self.days:
+            return
+        bitmap = self.bitmaps.get(day)
+        if bitmap is None:
+            bitmap = self.bitmaps[day] = bytearray()
+            for old in [d for d in self.bitmaps if d <= today - self.days]:
+                del self.bitmaps[old]
+        index = slot >> 3
+        if index >= len(bitmap):
+            bitmap.extend(bytes(index - len(bitmap) + 4096))
+        bitmap[index] |= 1 << (slot & 7)
+
+    def touch(self, record):
+        """Record activity; returns True when last_seen moved to a new bucket"""
+        now = int(time.time())
+        self._mark(record.activity_slot, now // 86400)
+        bucket = now - now % self.granularity
+        if record.last_seen == bucket:
+            return False
+        record.last_seen = bucket
+        return True
+
+    def active_users(self, days=1):
+        today = int(time.time()) // 86400
+        combined = 0
+        for day in range(today - days + 1, today + 1):
+            if day in self.bitmaps:
+                combined |= int.from_bytes(self.bitmaps[day], "little")
+        return combined.bit_count()
+
+activity = ActivityTracker(LAST_SEEN_GRANULARITY)
+
+def register_user(record):
+    stats.add_user(record)
+    activity.assign(record)
 
 def ensure_user_record(user):
     if user.id not in _users:
-        _users[user.id] = {
-            "user_id": user.id,
-            "username": user.username,
-            "first_name": user.first_name,
-            "is_premium": False,
-            "is_admin": is_admin(user.id),
-            "messages": 0,
-            "xp": 0,
-            "coins": 100,  # Starting coins
-            "level": 1,
-            "language": "en",
-            "joined_at": datetime.now(timezone.utc),
-            "last_seen": datetime.now(timezone.utc),
-            "games_played": 0,
-            "referrals": 0,
-            "referral_code": f"ref_{user.id}",
-            "referred_by": None,
-            "has_joined_channel": False,
-            "has_joined_group": False,
-        }
-    _users[user.id]["last_seen"] = datetime.now(timezone.utc)
+        _users[user.id] = UserRecord(user.id, user.username, user.first_name)
+        register_user(_users[user.id])
+        user_store.mark_dirty(user.id)
+    # Only persist last_seen when it moves to a new LAST_SEEN_GRANULARITY bucket
+    if activity.touch(_users[user.id]):
+        user_store.mark_dirty(user.id)
     return _users[user.id]
 
 def add_xp(user_id, amount):
     if user_id in _users:
         _users[user_id]["xp"] += amount
+        user_store.mark_dirty(user_id)
+        stats.changed(_users[user_id], "xp")
         # Check level up (100 XP per level)
         new_level = _users[user_id]["xp"] // 100 + 1
         if new_level > _users[user_id]["level"]:
             _users[user_id]["level"] = new_level
-            _users[user_id]["coins"] += new_level * 10  # Reward for leveling up
+            add_coins(user_id, new_level * 10)  # Reward for leveling up
             return True, new_level
     return False, 0
 
 def add_coins(user_id, amount):
     if user_id in _users:
         _users[user_id]["coins"] += amount
+        user_store.mark_dirty(user_id)
+        stats.total_coins += amount
+        stats.changed(_users[user_id], "coins")
         return True
     return False
 
-# ================== VIRAL CONTENT SYSTEMS ==================
-class ContentSystem:
+def add_referral(user_id):
+    if user_id in _users:
+        _users[user_id]["referrals"] += 1
+        user_store.mark_dirty(user_id)
+        stats.changed(_users[user_id], "referrals")
+
+def record_game(user_id):
+    if user_id in _users:
+        _users[user_id]["games_played"] += 1
+        user_store.mark_dirty(user_id)
+        stats.total_games += 1
+
+def record_message(user_id):
+    if user_id in _users:
+        _users[user_id]["messages"] += 1
+        user_store.mark_dirty(user_id)
+        stats.total_messages += 1
+
+# ================== OUTBOUND HTTP ==================
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host that keeps failing"""
+
+class CircuitBreaker:
+    """Opens after CIRCUIT_FAILURES consecutive failures; after the cooldown one
+    trial request is let through and its outcome closes or re-opens it."""
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            self.opened_at = time.monotonic()  # half-open: hold other callers back during the trial
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class HttpClient:
+    """The single outbound HTTP client for external content: one pooled
+    aiohttp session with timeouts, jittered retries and a circuit breaker per host."""
     def __init__(self):
         self.session = None
-        
-    async def ensure_session(self):
+        self.breakers = {}
+
+    async def start(self):
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                limit_per_host=HTTP_POOL_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                headers={"User-Agent": "PlayPalBot/2.0"},
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(CIRCUIT_FAILURES, CIRCUIT_COOLDOWN)
+        return self.breakers[host]
+
+    async def get_json(self, url, params=None, headers=None):
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{host} is failing, skipping request")
+        await self.start()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            data = await self._fetch_json(url, params, headers, breaker)
+            outcome = "ok"
+            return data
+        finally:
+            http_fetch_latency.observe(time.perf_counter() - started, host=host, outcome=outcome)
+
+    async def _fetch_json(self, url, params, headers, breaker):
+        for attempt in range(HTTP_RETRIES + 1):
+            try:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    if response.status < 500 and response.status != 429:
+                        if response.status >= 400:
+                            # Our request's fault, not the host's, so don't retry it
+                            breaker.success()
+                            response.raise_for_status()
+                        # A 2xx only counts as a success once its body parses
+                        data = await response.json(content_type=None)
+                        breaker.success()
+                        return data
+                    error = aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status, message=response.reason or ""
+                    )
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+            if attempt < HTTP_RETRIES:
+                await asyncio.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
+        breaker.failure()
+        raise error
+
+http_client = HttpClient()
+
+# ================== TRIVIA BANK ==================
+def check_question(q):
+    """Raise ValueError unless q has everything /quiz reads"""
+    if not isinstance(q.get("question"), str):
+        raise ValueError("missing question text")
+    options = q.get("options")
+    if not isinstance(options, list) or len(options) < 2:
+        raise ValueError("needs at least two options")
+    answer = q.get("answer")
+    if not isinstance(answer, int) or not 0 <= answer < len(options):
+        raise ValueError("answer is not an option index")
+
+class TriviaBank:
+    """Trivia questions kept on disk as JSONL and decoded one line at a time.
+
+    Loading records only each line's byte offset plus, per (difficulty,
+    category) pool, an array of line numbers; the file itself is mmap'd so
+    question text never lives on the Python heap. Wildcard pools
+    (difficulty only, category only, everything) are built the same way.
+    """
+    FALLBACK_QUESTIONS = [
+        {
+            "question": "What is the largest planet in our solar system?",
+            "options": ["Earth", "Jupiter", "Saturn", "Mars"],
+            "answer": 1,
+            "difficulty": "easy",
+            "category": "science"
+        },
+        {
+            "question": "Which element has the chemical symbol 'Au'?",
+            "options": ["Silver", "Gold", "Argon", "Aluminum"],
+            "answer": 1,
+            "difficulty": "medium",
+            "category": "science"
+        },
+        {
+            "question": "What is the capital of Australia?",
+            "options": ["Sydney", "Melbourne", "Canberra", "Perth"],
+            "answer": 2,
+            "difficulty": "medium",
+            "category": "geography"
+        }
+    ]
+
+    def __init__(self):
+        self._file = None
+        self.load_bytes("".join(json.dumps(q) + "\n" for q in self.FALLBACK_QUESTIONS).encode())
+
+    def load(self, path):
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            print(f"⚠️ Trivia bank {path} not found, using built-in questions")
+            return
+        if os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            print(f"⚠️ Trivia bank {path} is empty, using built-in questions")
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        started = time.perf_counter()
+        old_buffer, old_file = self.buffer, self._file
+        self.load_bytes(buffer)
+        self._file = f
+        if old_file is not None:
+            old_buffer.close()
+            old_file.close()
+        print(f"🧠 Loaded {len(self)} trivia questions in {time.perf_counter() - started:.2f}s")
+
+    def load_bytes(self, buffer):
+        offsets = array("Q")
+        pools = {}
+        difficulties, categories = set(), set()
+        skipped, first_error = 0, None
+        start, end = 0, len(buffer)
+        while start < end:
+            stop = buffer.find(b"\n", start)
+            if stop == -1:
+                stop = end
+            line = buffer[start:stop].strip()
+            if line:
+                try:
+                    q = json.loads(line)
+                    difficulty, category = q["difficulty"], q.get("category", "general")
+                    check_question(q)
+                except (ValueError, KeyError, TypeError) as e:
+                    skipped += 1
+                    first_error = first_error or f"byte {start}: {e!r}"
+                else:
+                    index = len(offsets)
+                    offsets.append(start)
+                    difficulties.add(difficulty)
+                    categories.add(category)
+                    for key in ((difficulty, category), (difficulty, None), (None, category), (None, None)):
+                        pool = pools.get(key)
+                        if pool is None:
+                            pool = pools[key] = array("I")
+                        pool.append(index)
+            start = stop + 1
+        if skipped:
+            print(f"⚠️ Skipped {skipped} malformed trivia lines (first at {first_error})")
+        self.buffer = buffer
+        self.offsets = offsets
+        self.pools = pools
+        self.difficulties = sorted(difficulties)
+        self.categories = sorted(categories)
+
+    def close(self):
+        if self._file is not None:
+            self.buffer.close()
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def question(self, index):
+        start = self.offsets[index]
+        stop = self.buffer.find(b"\n", start)
+        return json.loads(self.buffer[start:stop if stop != -1 else len(self.buffer)])
+
+    def draw(self, cursors, difficulty=None, category=None):
+        """Next question from the pool without repeats until the pool is exhausted.
+
+        `cursors` maps pool key -> [a, b, k, n]: the k-th draw is
+        (a*k + b) mod n, a permutation of the pool since gcd(a, n) == 1, so
+        each user walks their own shuffled order in O(1) with no seen-set.
+        """
+        key = (difficulty, category)
+        pool = self.pools.get(key)
+        if not pool:
+            return None
+        n = len(pool)
+        cursor = cursors.get(key)
+        if cursor is None or cursor[2] >= cursor[3] or cursor[3] != n:
+            a = random.randrange(1, n) if n > 1 else 1
+            while math.gcd(a, n) != 1:
+                a = random.randrange(1, n)
+            cursor = cursors[key] = [a, random.randrange(n), 0, n]
+        a, b, k, _ = cursor
+        cursor[2] += 1
+        return self.question(pool[(a * k + b) % n])
+
+trivia_bank = TriviaBank()
+
+# ================== VIRAL CONTENT SYSTEMS ==================
+class RotatingFeed:
+    """Items ingested from one upstream, served round-robin from memory.
+
+    A background job replaces the whole buffer on each refresh; items are no
+    longer served once the last successful refresh is older than `ttl`.
+    """
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.items = []
+        self.cursor = 0
+        self.fetched_at = None
+        self.last_refresh_latency = 0.0
+
+    @property
+    def fresh(self):
+        return self.fetched_at is not None and time.time() - self.fetched_at < self.ttl
+
+    def replace(self, items, latency):
+        feed_refreshes.inc(feed=self.name, outcome="ok")
+        self.last_refresh_latency = latency
+        if items:
+            self.items = items
+            self.cursor = 0
+            self.fetched_at = time.time()
+
+    def take(self, count=1):
+        if not self.items or not self.fresh:
+            feed_lookups.inc(feed=self.name, outcome="miss")
+            return []
+        feed_lookups.inc(feed=self.name, outcome="hit")
+        taken = []
+        for _ in range(min(count, len(self.items))):
+            taken.append(self.items[self.cursor])
+            self.cursor = (self.cursor + 1) % len(self.items)
+        return taken
+
+    def metrics(self):
+        return {
+            f"{self.name}_feed_items": len(self.items) if self.fresh else 0,
+            f"{self.name}_feed_age_seconds": time.time() - self.fetched_at if self.fetched_at else -1,
+            f"{self.name}_feed_refresh_latency_seconds": self.last_refresh_latency,
+        }
+
+def parse_news(data):
+    return [
+        {"title": article["title"], "source": (article.get("source") or {}).get("name") or "News", "url": article["url"]}
+        for article in data.get("articles", [])
+        if article.get("title") and article.get("url") and article["title"] != "[Removed]"
+    ]
+
+def parse_gifs(data):
+    gifs = []
+    for gif in data.get("data", []):
+        url = gif.get("images", {}).get("downsized", {}).get("url") or gif.get("images", {}).get("original", {}).get("url")
+        if url:
+            gifs.append({"title": gif.get("title") or "Trending GIF", "url": url})
+    return gifs
+
+class MemePool:
+    """Bounded pool of pre-fetched memes, de-duplicated by URL for MEME_SEEN_TTL"""
+    def __init__(self, size, seen_ttl):
+        self.size = size
+        self.seen_ttl = seen_ttl
+        self.memes = deque()
+        self.seen = OrderedDict()  # url -> expiry; insertion order is expiry order
+        self.low = asyncio.Event()
+        self.low.set()
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.last_refill_latency = 0.0
+        self.total_refill_latency = 0.0
+
+    def pop(self):
+        if self.memes:
+            self.hits += 1
+            meme_pool_lookups.inc(outcome="hit")
+            meme = self.memes.popleft()
+        else:
+            self.misses += 1
+            meme_pool_lookups.inc(outcome="miss")
+            meme = None
+        if len(self.memes) < self.size // 2:
+            self.low.set()
+        return meme
+
+    def add(self, candidates):
+        now = time.monotonic()
+        while self.seen and next(iter(self.seen.values())) < now:
+            self.seen.popitem(last=False)
+        added = 0
+        for data in candidates:
+            url = data.get("url", "")
+            if data.get("nsfw") or data.get("spoiler") or url in self.seen:
+                continue
+            if not url.lower().endswith((".jpg", ".jpeg", ".png")):
+                continue  # reply_photo can't send gifs/videos
+            if len(self.memes) >= self.size:
+                break
+            self.seen[url] = now + self.seen_ttl
+            self.memes.append({
+                'url': url,
+                'title': data['title'],
+                'source': f"r/{data['subreddit']}"
+            })
+            added += 1
+        return added
+
+    def record_refill(self, latency):
+        self.refills += 1
+        meme_pool_refills.inc()
+        self.last_refill_latency = latency
+        self.total_refill_latency += latency
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "meme_pool_size": len(self.memes),
+            "meme_pool_hit_rate": self.hits / lookups if lookups else 0.0,
+            "meme_refill_latency_seconds": self.last_refill_latency,
+            "meme_refill_latency_avg_seconds": self.total_refill_latency / self.refills if self.refills else 0.0,
+        }
+
+class ContentSystem:
+    FALLBACK_MEMES = [
+        {'url': 'https://i.imgflip.com/1bij.jpg', 'title': 'One Does Not Simply', 'source': 'Classic Meme'},
+        {'url': 'https://i.imgflip.com/261o3j.jpg', 'title': 'But that\'s none of my business', 'source': 'Kermit'},
+    ]
+
+    FACTS = [
+        "Honey never spoils. Archaeologists have found pots of honey in ancient Egyptian tombs that are over 3,000 years old and still perfectly edible!",
+        "Octopuses have three hearts and blue blood!",
+        "A group of flamingos is called a 'flamboyance'!",
+        "The shortest war in history was between Britain and Zanzibar in 1896. Zanzibar surrendered after 38 minutes!",
+        "Bananas are berries, but strawberries aren't!",
+    ]
+    QUOTES = [
+        "The only way to do great work is to love what you do. - Steve Jobs",
+        "Believe you can and you're halfway there. - Theodore Roosevelt",
+        "Your time is limited, don't waste it living someone else's life. - Steve Jobs",
+        "It always seems impossible until it's done. - Nelson Mandela",
+        "Success is not final, failure is not fatal: It is the courage to continue that counts. - Winston Churchill",
+    ]
+    JOKES = [
+        "Why don't scientists trust atoms? Because they make up everything!",
+    ]
+    TIPS = [
+        "💡 Pro Tip: Play games daily to earn more coins and level up faster!",
+    ]
+    # Text-only surprise types: (items, message template, parse mode)
+    SURPRISE_TEXTS = {
+        "fact": (FACTS, "🎁 *Surprise Fact!* 🎁\n\n{}", ParseMode.MARKDOWN),
+        "quote": (QUOTES, "🎁 *Surprise Quote!* 🎁\n\n{}", ParseMode.MARKDOWN),
+        "joke": (JOKES, "🎁 *Surprise Joke!* 🎁\n\n{}", None),
+        "tip": (TIPS, "🎁 *Surprise Tip!* 🎁\n\n{}", None),
+    }
+
+    def __init__(self):
+        self.meme_pool = MemePool(MEME_POOL_SIZE, MEME_SEEN_TTL)
+        self._refill_task = None
+        self.news = RotatingFeed("news", FEED_TTL)
+        self.gifs = RotatingFeed("gif", FEED_TTL)
+        # name -> (feed, url, query params, parser); only sources with an API key are ingested
+        self.feed_sources = {}
+        if NEWS_API:
+            self.feed_sources["news"] = (self.news, NEWS_API_URL, {"country": NEWS_COUNTRY, "pageSize": 50, "apiKey": NEWS_API}, parse_news)
+        if GIPHY_API:
+            self.feed_sources["gif"] = (self.gifs, GIPHY_API_URL, {"api_key": GIPHY_API, "limit": 50, "rating": "pg"}, parse_gifs)
+        self._ingest_task = None
+        self._surprise_types = list(SURPRISE_WEIGHTS)
+        self._surprise_weights = list(SURPRISE_WEIGHTS.values())
+        # Render every text-only surprise once instead of per request
+        self._rendered_surprises = {
+            kind: [(template.format(item), parse_mode) for item in items]
+            for kind, (items, template, parse_mode) in self.SURPRISE_TEXTS.items()
+        }
         
     async def get_daily_fact(self):
-        facts = [
-            "Honey never spoils. Archaeologists have found pots of honey in ancient Egyptian tombs that are over 3,000 years old and still perfectly edible!",
-            "Octopuses have three hearts and blue blood!",
-            "A group of flamingos is called a 'flamboyance'!",
-            "The shortest war in history was between Britain and Zanzibar in 1896. Zanzibar surrendered after 38 minutes!",
-            "Bananas are berries, but strawberries aren't!",
-        ]
-        return random.choice(facts)
+        return random.choice(self.FACTS)
     
     async def get_motivational_quote(self):
-        quotes = [
-            "The only way to do great work is to love what you do. - Steve Jobs",
-            "Believe you can and you're halfway there. - Theodore Roosevelt",
-            "Your time is limited, don't waste it living someone else's life. - Steve Jobs",
-            "It always seems impossible until it's done. - Nelson Mandela",
-            "Success is not final, failure is not fatal: It is the courage to continue that counts. - Winston Churchill",
-        ]
-        return random.choice(quotes)
+        return random.choice(self.QUOTES)
     
-    async def get_viral_meme(self):
+    def start(self):
+        self._refill_task = asyncio.create_task(self._refill_memes())
+        if self.feed_sources:
+            self._ingest_task = asyncio.create_task(self._ingest_feeds())
+
+    async def stop(self):
+        tasks = [task for task in (self._refill_task, self._ingest_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refill_task = self._ingest_task = None
+
+    async def refresh_feed(self, name):
+        feed, url, params, parse = self.feed_sources[name]
+        started = time.monotonic()
         try:
-            await self.ensure_session()
-            async with self.session.get('https://meme-api.com/gimme') as response:
-                data = await response.json()
-                if not data['nsfw']:
-                    return {
-                        'url': data['url'],
-                        'title': data['title'],
-                        'source': f"r/{data['subreddit']}"
-                    }
-        except:
-            pass
+            data = await http_client.get_json(url, params=params)
+            feed.replace(parse(data), time.monotonic() - started)
+        except Exception as e:
+            feed_refreshes.inc(feed=feed.name, outcome="failed")
+            print(f"Refreshing {name} feed failed: {e}")
+
+    async def _ingest_feeds(self):
+        """Periodically refresh every configured feed; commands only read the buffers"""
+        while True:
+            await asyncio.gather(*(self.refresh_feed(name) for name in self.feed_sources))
+            await asyncio.sleep(FEED_REFRESH_INTERVAL)
+
+    def feed_metrics(self):
+        metrics = {}
+        for feed in (self.news, self.gifs):
+            metrics.update(feed.metrics())
+        return metrics
+
+    async def _refill_memes(self):
+        """Keep the meme pool topped up with batches from /gimme/N"""
+        backoff = 5
+        while True:
+            await self.meme_pool.low.wait()
+            started = time.monotonic()
+            try:
+                data = await http_client.get_json(f'https://meme-api.com/gimme/{MEME_BATCH_SIZE}')
+                self.meme_pool.record_refill(time.monotonic() - started)
+                if not self.meme_pool.add(data.get('memes', [])):
+                    raise ValueError("batch had no new memes")
+                backoff = 5
+            except Exception as e:
+                print(f"Meme refill failed: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+                continue
+            if len(self.meme_pool.memes) >= self.meme_pool.size // 2:
+                self.meme_pool.low.clear()
+
+    async def get_viral_meme(self):
+        meme = self.meme_pool.pop()
+        if meme is not None:
+            return meme
         
-        # Fallback memes
-        memes = [
-            {'url': 'https://i.imgflip.com/1bij.jpg', 'title': 'One Does Not Simply', 'source': 'Classic Meme'},
-            {'url': 'https://i.imgflip.com/261o3j.jpg', 'title': 'But that\'s none of my business', 'source': 'Kermit'},
-        ]
-        return random.choice(memes)
-    
-    async def get_trivia_question(self):
-        questions = [
-            {
-                "question": "What is the largest planet in our solar system?",
-                "options": ["Earth", "Jupiter", "Saturn", "Mars"],
-                "answer": 1,
-                "difficulty": "easy"
-            },
-            {
-                "question": "Which element has the chemical symbol 'Au'?",
-                "options": ["Silver", "Gold", "Argon", "Aluminum"],
-                "answer": 1,
-                "difficulty": "medium"
-            },
-            {
-                "question": "What is the capital of Australia?",
-                "options": ["Sydney", "Melbourne", "Canberra", "Perth"],
-                "answer": 2,
-                "difficulty": "medium"
-            }
-        ]
-        return random.choice(questions)
+        # Fallback memes while the pool is empty
+        return random.choice(self.FALLBACK_MEMES)
+    
+    async def get_trivia_question(self, user_id, difficulty=None, category=None):
+        session = _user_sessions.get(user_id)
+        if session is None:
+            session = _user_sessions[user_id] = {}
+            while len(_user_sessions) > USER_SESSION_LIMIT:
+                _user_sessions.popitem(last=False)
+        else:
+            _user_sessions.move_to_end(user_id)
+        cursors = session.setdefault("trivia", {})
+        return trivia_bank.draw(cursors, difficulty, category)
     
     async def get_surprise_content(self):
-        """Get random surprise content"""
-        surprises = [
-            {"type": "fact", "content": await self.get_daily_fact()},
-            {"type": "quote", "content": await self.get_motivational_quote()},
-            {"type": "meme", "content": await self.get_viral_meme()},
-            {"type": "joke", "content": "Why don't scientists trust atoms? Because they make up everything!"},
-            {"type": "tip", "content": "💡 Pro Tip: Play games daily to earn more coins and level up faster!"},
-        ]
-        return random.choice(surprises)
+        """Pick the surprise type first, then produce only that content"""
+        kind = random.choices(self._surprise_types, weights=self._surprise_weights)[0]
+        if kind == "meme":
+            return {"type": "meme", "content": await self.get_viral_meme()}
+        text, parse_mode = random.choice(self._rendered_surprises[kind])
+        return {"type": kind, "text": text, "parse_mode": parse_mode}
 
 content_system = ContentSystem()
 
+# ================== MEDIA CACHE ==================
+class FileIdCache:
+    """LRU map of source URL -> Telegram file_id so hot media is uploaded only once"""
+    CHECKPOINT_KEY = "file_ids"
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.dirty = False
+
+    def get(self, url):
+        file_id = self.entries.get(url)
+        if file_id is not None:
+            self.entries.move_to_end(url)
+        return file_id
+
+    def put(self, url, file_id):
+        self.entries[url] = file_id
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def evict(self, url):
+        if self.entries.pop(url, None) is not None:
+            self.dirty = True
+
+    async def load(self):
+        for url, file_id in await user_store.load_meta(self.CHECKPOINT_KEY) or []:
+            self.put(url, file_id)
+        self.dirty = False
+
+    async def save(self):
+        if self.dirty:
+            # Stored as pairs, oldest first, to keep the LRU order
+            await user_store.save_meta(self.CHECKPOINT_KEY, list(self.entries.items()))
+            self.dirty = False
+
+file_id_cache = FileIdCache(FILE_ID_CACHE_SIZE)
+
+async def reply_cached_media(message, url, kind="photo", **kwargs):
+    """reply_photo/reply_animation that reuses the file_id from the first
+    successful send of `url`"""
+    send = message.reply_photo if kind == "photo" else message.reply_animation
+    file_id = file_id_cache.get(url)
+    if file_id is not None:
+        try:
+            return await send(file_id, **kwargs)
+        except BadRequest as e:
+            print(f"Dropping stale file_id for {url}: {e}")
+            file_id_cache.evict(url)
+    sent = await send(url, **kwargs)
+    media = sent.photo[-1] if kind == "photo" and sent.photo else sent.animation
+    if media:
+        file_id_cache.put(url, media.file_id)
+    return sent
+
+# ================== REPLY BUFFER ==================
+# Replies made while handling one update are collected here and sent when
+# the handler returns, so a level-up notice and the actual answer, or a meme
+# title and its picture, go out as one message instead of two.
+_reply_buffer = contextvars.ContextVar("reply_buffer", default=None)
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+def renders_plain(text, parse_mode):
+    """Whether `text` looks the same under `parse_mode` as without one"""
+    if parse_mode == ParseMode.MARKDOWN:
+        return not any(c in text for c in "*_`[")
+    if parse_mode == ParseMode.HTML:
+        return not any(c in text for c in "<>&")
+    return False
+
+def shared_parse_mode(first, second):
+    """Parse mode two replies' texts can be joined under, or False"""
+    first_mode, second_mode = first["kwargs"].get("parse_mode"), second["kwargs"].get("parse_mode")
+    if first_mode == second_mode:
+        return first_mode
+    if first_mode is None and renders_plain(first["text"], second_mode):
+        return second_mode
+    if second_mode is None and renders_plain(second["text"], first_mode):
+        return first_mode
+    return False
+
+class ReplyBuffer:
+    """Pending replies to one update's message.
+
+    Consecutive texts are joined into one message, and a text followed by an
+    uncaptioned photo/GIF becomes its caption, when the parse modes agree and
+    Telegram's length limits allow. A reply is only folded into an earlier
+    one that has no keyboard, and a reply with on_sent or separate=True is
+    never folded, so it arrives as a message of its own.
+    """
+    def __init__(self, message):
+        self.message = message
+        self.replies = []
+
+    def add(self, kind, text, url=None, on_sent=None, separate=False, **kwargs):
+        reply = {"kind": kind, "text": text, "url": url, "kwargs": kwargs, "on_sent": on_sent}
+        if self.replies and on_sent is None and not separate and self._fold(self.replies[-1], reply):
+            replies_coalesced.inc(kind=kind)
+            return
+        self.replies.append(reply)
+
+    def _fold(self, previous, reply):
+        if previous["kind"] != "text" or set(previous["kwargs"]) - {"parse_mode"}:
+            return False  # a keyboard or link-preview option belongs to the earlier message
+        if reply["kind"] == "text":
+            parse_mode = shared_parse_mode(previous, reply)
+            text = f"{previous['text']}\n\n{reply['text']}"
+            if parse_mode is False or len(text) > TEXT_LIMIT:
+                return False
+        else:
+            parse_mode = previous["kwargs"].get("parse_mode")
+            text = previous["text"]
+            if reply["text"] is not None or len(text) > CAPTION_LIMIT:
+                return False
+        previous.update(kind=reply["kind"], text=text, url=reply["url"], kwargs=dict(reply["kwargs"]))
+        if parse_mode is not None:
+            previous["kwargs"]["parse_mode"] = parse_mode
+        return True
+
+    async def flush(self):
+        """Send every pending reply; a failed send doesn't stop the ones after
+        it, and the first failure is raised once they have all been tried"""
+        replies, self.replies = self.replies, []
+        error = None
+        for reply in replies:
+            try:
+                if reply["kind"] == "text":
+                    sent = await self.message.reply_text(reply["text"], **reply["kwargs"])
+                else:
+                    if reply["text"] is not None:
+                        reply["kwargs"]["caption"] = reply["text"]
+                    sent = await reply_cached_media(self.message, reply["url"], reply["kind"], **reply["kwargs"])
+            except Exception as e:
+                error = error or e
+                continue
+            if reply["on_sent"] is not None:
+                reply["on_sent"](sent)
+        if error is not None:
+            raise error
+
+def coalesce_replies(callback):
+    """Buffer a handler's replies and send them when it returns (apply at registration)"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        if update.message is None or _reply_buffer.get() is not None:
+            return await callback(update, context)
+        buffer = ReplyBuffer(update.message)
+        token = _reply_buffer.set(buffer)
+        try:
+            result = await callback(update, context)
+        finally:
+            _reply_buffer.reset(token)
+        # A failed handler's partial replies are dropped; a failed send is
+        # raised like any handler error, after the other replies go out
+        await buffer.flush()
+        return result
+    return wrapper
+
+async def reply_text(message, text, on_sent=None, separate=False, **kwargs):
+    """message.reply_text, deferred to the update's reply buffer when there is one.
+
+    Returns the sent message only when sent right away; pass on_sent to get
+    it either way. separate=True keeps the text out of the previous reply.
+    """
+    buffer = _reply_buffer.get()
+    if buffer is not None and buffer.message is message:
+        buffer.add("text", text, on_sent=on_sent, separate=separate, **kwargs)
+        return None
+    sent = await message.reply_text(text, **kwargs)
+    if on_sent is not None:
+        on_sent(sent)
+    return sent
+
+async def reply_media(message, url, kind="photo", caption=None, **kwargs):
+    """reply_cached_media, deferred to the update's reply buffer when there is one"""
+    buffer = _reply_buffer.get()
+    if buffer is not None and buffer.message is message:
+        buffer.add(kind, caption, url=url, **kwargs)
+        return None
+    if caption is not None:
+        kwargs["caption"] = caption
+    return await reply_cached_media(message, url, kind, **kwargs)
+
 # ================== GAME SYSTEMS ==================
+class GameExpiryScheduler:
+    """Expires active games at their deadline from a min-heap on the bot's event loop.
+
+    Answered or replaced games are skipped lazily when their heap entry comes up,
+    so scheduling and expiring are both O(log n) and nothing scans _active_games.
+    """
+    def __init__(self):
+        self.heap = []  # (deadline, seq, game_id)
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.notices = set()  # pending timeout notices, kept referenced until done
+        self.bot = None
+
+    def schedule(self, game_id, deadline):
+        heapq.heappush(self.heap, (deadline, next(self.seq), game_id))
+        if self.heap[0][2] == game_id:
+            self.wakeup.set()  # new earliest deadline
+
+    def start(self, bot):
+        self.bot = bot
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        # Let notices already being sent finish
+        await asyncio.gather(*self.notices, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            deadline, _, game_id = heapq.heappop(self.heap)
+            game = _active_games.get(game_id)
+            if game is None or game["deadline"] != deadline:
+                continue
+            del _active_games[game_id]
+            notice = asyncio.create_task(self._notify_timeout(game))
+            self.notices.add(notice)
+            notice.add_done_callback(self.notices.discard)
+
+    async def _notify_timeout(self, game):
+        question = game["question"]
+        text = (
+            f"⏰ *Time's up!*\n\n"
+            f"Your quiz expired. The correct answer was: {question['options'][question['answer']]}\n\n"
+            f"Try again with /quiz!"
+        )
+        try:
+            if game.get("message_id") is not None:
+                # Replace the quiz (and its buttons) in place
+                await self.bot.edit_message_text(
+                    f"{format_quiz(game)}\n\n{text}",
+                    chat_id=game["chat_id"],
+                    message_id=game["message_id"],
+                    parse_mode=ParseMode.MARKDOWN,
+                    rate_limit_args=BACKGROUND
+                )
+            else:
+                await self.bot.send_message(
+                    chat_id=game["chat_id"], text=text, parse_mode=ParseMode.MARKDOWN, rate_limit_args=BACKGROUND
+                )
+        except Exception as e:
+            print(f"Failed to send quiz timeout notice: {e}")
+
+game_expiry = GameExpiryScheduler()
+
 class GameSystem:
-    async def start_quiz(self, user_id, chat_id):
-        question = await content_system.get_trivia_question()
+    async def start_quiz(self, user_id, chat_id, difficulty=None, category=None):
+        question = await content_system.get_trivia_question(user_id, difficulty, category)
+        if question is None:
+            return None
         game_id = f"{chat_id}_{user_id}"
+        deadline = time.monotonic() + QUIZ_TIMEOUT
         
-        _active_games[game_id] = {
+        # A new quiz replaces the user's previous one in this chat; the token
+        # in each button's callback_data tells stale buttons apart
+        game = _active_games[game_id] = {
             "type": "quiz",
+            "token": f"{random.getrandbits(32):08x}",
             "question": question,
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "message_id": None,
             "start_time": datetime.now(),
+            "deadline": deadline,
             "reward": random.randint(15, 25)
         }
+        game_expiry.schedule(game_id, deadline)
         
-        return question
+        return game
     
     async def start_slot_machine(self, user_id, bet_amount):
         user = _users.get(user_id)
@@ -210,28 +1654,17 @@ class GameSystem:
             return None, "Not enough coins!"
         
         # Deduct bet
-        user["coins"] -= bet_amount
-        
-        # Generate slot result
-        symbols = ["🍒", "🍋", "🍊", "🍇", "🔔", "💎", "7️⃣"]
-        result = [random.choice(symbols) for _ in range(3)]
-        
-        # Calculate win
-        win_multiplier = 0
-        if result[0] == result[1] == result[2]:
-            if result[0] == "💎": win_multiplier = 10
-            elif result[0] == "7️⃣": win_multiplier = 5
-            else: win_multiplier = 3
-        elif result[0] == result[1] or result[1] == result[2]:
-            win_multiplier = 1.5
+        add_coins(user_id, -bet_amount)
         
+        result, win_multiplier = slot_machine.spin()
         win_amount = int(bet_amount * win_multiplier) if win_multiplier > 0 else 0
         
         if win_amount > 0:
-            user["coins"] += win_amount
+            add_coins(user_id, win_amount)
         
         return result, win_amount
 
+slot_machine = SlotMachine(load_table(SLOTS_TABLE) if SLOTS_TABLE else DEFAULT_PAYOUT_TABLE)
 game_system = GameSystem()
 
 # ================== UI HELPERS ==================
@@ -253,6 +1686,7 @@ def fun_menu_kb():
     return ReplyKeyboardMarkup([
         ["📰 Daily Fact", "💬 Quote"],
         ["😂 Meme", "🎁 Surprise"],
+        ["🗞 News", "🎞 GIF"],
         ["⬅️ Back"]
     ], resize_keyboard=True)
 
@@ -263,6 +1697,14 @@ def social_menu_kb():
     ], resize_keyboard=True)
 
 # ================== REFERRAL SYSTEM ==================
+def find_referrer_id(referral_code):
+    """O(1) lookup of the cached user that owns a referral code"""
+    # Codes are always ref_<user_id>, so the owner is read off the code itself
+    suffix = referral_code[4:]
+    if suffix.isdigit() and int(suffix) in _users:
+        return int(suffix)
+    return None
+
 async def handle_referral_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle referral codes in start command"""
     user = update.effective_user
@@ -271,15 +1713,13 @@ async def handle_referral_start(update: Update, context: ContextTypes.DEFAULT_TY
     if context.args and len(context.args) > 0:
         referral_code = context.args[0]
         if referral_code.startswith("ref_") and referral_code != user_record["referral_code"]:
-            # Find the referrer
-            for uid, data in _users.items():
-                if data["referral_code"] == referral_code:
-                    # Add referral bonus to both users
-                    add_coins(uid, 50)  # Referrer gets 50 coins
-                    add_coins(user.id, 50)  # New user gets 50 coins
-                    _users[uid]["referrals"] += 1
-                    user_record["referred_by"] = uid
-                    return True
+            # The shard owning the referrer pays their bonus (this one when not sharded)
+            uid = await credit_referrer(context.bot, referral_code)
+            if uid is not None:
+                add_coins(user.id, 50)  # New user gets 50 coins
+                user_record["referred_by"] = uid
+                user_store.mark_dirty(user.id)
+                return True
     return False
 
 # ================== GAME COMMANDS ==================
@@ -288,80 +1728,115 @@ async def cmd_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_record = ensure_user_record(user)
     chat_id = update.effective_chat.id
     
-    question = await game_system.start_quiz(user.id, chat_id)
+    # Optional filters: /quiz [difficulty] [category], in any order
+    difficulty = category = None
+    for arg in (a.lower() for a in context.args or []):
+        if arg in trivia_bank.difficulties:
+            difficulty = arg
+        elif arg in trivia_bank.categories:
+            category = arg
+        else:
+            await reply_text(
+                update.message,
+                f"Unknown quiz option '{arg}'.\n"
+                f"Difficulties: {', '.join(trivia_bank.difficulties)}\n"
+                f"Categories: {', '.join(trivia_bank.categories)}"
+            )
+            return
     
-    # Format options with numbers
-    options_text = "\n".join([f"{i+1}. {opt}" for i, opt in enumerate(question["options"])])
+    game = await game_system.start_quiz(user.id, chat_id, difficulty, category)
+    if game is None:
+        await reply_text(update.message, "No questions match that difficulty and category yet, try another combination!")
+        return
     
-    quiz_text = (
+    await reply_text(
+        update.message,
+        f"{format_quiz(game)}\n\nTap your answer below!",
+        reply_markup=quiz_kb(game),
+        parse_mode=ParseMode.MARKDOWN,
+        on_sent=lambda sent: game.update(message_id=sent.message_id)
+    )
+
+def format_quiz(game):
+    question = game["question"]
+    return (
         f"🎯 *Quiz Time!* 🎯\n\n"
         f"*{question['question']}*\n\n"
-        f"{options_text}\n\n"
         f"💡 Difficulty: {question['difficulty'].title()}\n"
-        f"💰 Reward: {_active_games[f'{chat_id}_{user.id}']['reward']} coins\n\n"
-        f"Reply with the number of your answer!"
+        f"📚 Category: {question.get('category', 'general').title()}\n"
+        f"💰 Reward: {game['reward']} coins"
     )
-    
-    await update.message.reply_text(quiz_text, parse_mode=ParseMode.MARKDOWN)
 
-async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def quiz_kb(game):
+    # callback_data is q:<token>:<option index>, well under Telegram's 64 bytes
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(option, callback_data=f"q:{game['token']}:{i}")]
+        for i, option in enumerate(game["question"]["options"])
+    ])
+
+async def handle_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, token, choice):
+    query = update.callback_query
     user = update.effective_user
-    chat_id = update.effective_chat.id
-    game_id = f"{chat_id}_{user.id}"
+    game_id = f"{query.message.chat.id}_{user.id}"
+    game = _active_games.get(game_id)
     
-    if game_id not in _active_games or _active_games[game_id]["type"] != "quiz":
+    # Other players' buttons and buttons of answered/expired quizzes resolve
+    # to no game (or a different token) for this user
+    if game is None or game["token"] != token:
+        await query.answer("This quiz isn't yours or has already ended.", show_alert=True)
         return
     
+    question = game["question"]
     try:
-        answer = int(update.message.text.strip()) - 1
-        question = _active_games[game_id]["question"]
-        reward = _active_games[game_id]["reward"]
-        
-        if answer == question["answer"]:
-            # Correct answer
-            add_coins(user.id, reward)
-            user_record = ensure_user_record(user)
-            user_record["games_played"] += 1
-            response = (
-                f"✅ *Correct!* 🎉\n\n"
-                f"You won {reward} coins!\n"
-                f"Your total: {_users[user.id]['coins']} coins"
-            )
-        else:
-            # Wrong answer
-            correct_option = question["options"][question["answer"]]
-            response = (
-                f"❌ *Wrong answer!*\n\n"
-                f"The correct answer was: {correct_option}\n\n"
-                f"Better luck next time! 😊"
-            )
-        
-        # Remove the active game
-        del _active_games[game_id]
-        
-        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
-        
-    except (ValueError, IndexError):
-        await update.message.reply_text("Please reply with a valid number (1, 2, 3, etc.)")
+        answer = int(choice)
+    except ValueError:
+        await query.answer()
+        return
+    
+    del _active_games[game_id]
+    ensure_user_record(user)
+    
+    if answer == question["answer"]:
+        # Correct answer
+        add_coins(user.id, game["reward"])
+        record_game(user.id)
+        await query.answer(f"✅ +{game['reward']} coins!")
+        response = (
+            f"✅ *Correct!* 🎉\n\n"
+            f"You won {game['reward']} coins!\n"
+            f"Your total: {_users[user.id]['coins']} coins"
+        )
+    else:
+        # Wrong answer
+        correct_option = question["options"][question["answer"]]
+        await query.answer("❌ Wrong answer!")
+        response = (
+            f"❌ *Wrong answer!*\n\n"
+            f"The correct answer was: {correct_option}\n\n"
+            f"Better luck next time! 😊"
+        )
+    
+    # Show the result in place of the buttons
+    await query.edit_message_text(f"{format_quiz(game)}\n\n{response}", parse_mode=ParseMode.MARKDOWN)
 
 async def cmd_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_record = ensure_user_record(user)
     
     if not context.args:
-        await update.message.reply_text("Usage: /slots <bet_amount>\nExample: /slots 10")
+        await reply_text(update.message, "Usage: /slots <bet_amount>\nExample: /slots 10")
         return
     
     try:
         bet_amount = int(context.args[0])
         if bet_amount < 1:
-            await update.message.reply_text("Bet amount must be at least 1 coin!")
+            await reply_text(update.message, "Bet amount must be at least 1 coin!")
             return
         
         result, win_amount = await game_system.start_slot_machine(user.id, bet_amount)
         
         if result is None:
-            await update.message.reply_text(win_amount)  # Error message
+            await reply_text(update.message, win_amount)  # Error message
             return
         
         slot_display = " | ".join(result)
@@ -381,142 +1856,811 @@ async def cmd_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"Balance: {user_record['coins']} coins"
             )
         
-        user_record["games_played"] += 1
-        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
+        record_game(user.id)
+        await reply_text(update.message, response, parse_mode=ParseMode.MARKDOWN)
         
     except ValueError:
-        await update.message.reply_text("Please enter a valid number for your bet!")
+        await reply_text(update.message, "Please enter a valid number for your bet!")
 
 # ================== CONTENT COMMANDS ==================
 async def cmd_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     fact = await content_system.get_daily_fact()
-    await update.message.reply_text(f"📚 *Did You Know?*\n\n{fact}", parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, f"📚 *Did You Know?*\n\n{fact}", parse_mode=ParseMode.MARKDOWN)
 
 async def cmd_quote(update: Update, context: ContextTypes.DEFAULT_TYPE):
     quote = await content_system.get_motivational_quote()
-    await update.message.reply_text(f"💬 *Motivational Quote*\n\n{quote}", parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, f"💬 *Motivational Quote*\n\n{quote}", parse_mode=ParseMode.MARKDOWN)
+
+async def cmd_meme(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    meme = await content_system.get_viral_meme()
+    await reply_text(update.message, f"😂 *Viral Meme*\n\n*{meme['title']}*\nFrom: {meme['source']}")
+    await reply_media(update.message, meme['url'])
+
+async def cmd_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    headlines = content_system.news.take(5)
+    if not headlines:
+        await reply_text(update.message, "🗞 No fresh headlines right now, check back soon!")
+        return
+    
+    lines = [f"{i+1}. {item['title']} ({item['source']})\n{item['url']}" for i, item in enumerate(headlines)]
+    await reply_text(
+        update.message,
+        "🗞 Top Headlines\n\n" + "\n\n".join(lines),
+        disable_web_page_preview=True
+    )
+
+async def cmd_gif(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    gifs = content_system.gifs.take()
+    if not gifs:
+        await reply_text(update.message, "🎞 No trending GIFs right now, check back soon!")
+        return
+    
+    await reply_media(update.message, gifs[0]['url'], kind="animation", caption=gifs[0]['title'])
+
+async def cmd_surprise(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    surprise = await content_system.get_surprise_content()
+    
+    if surprise["type"] == "meme":
+        meme = surprise['content']
+        await reply_text(update.message, f"🎁 *Surprise Meme!* 🎁\n\n*{meme['title']}*\nFrom: {meme['source']}")
+        await reply_media(update.message, meme['url'])
+    else:
+        await reply_text(update.message, surprise["text"], parse_mode=surprise["parse_mode"])
+
+
+# ================== ECONOMY COMMANDS ==================
+async def cmd_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    user_record = ensure_user_record(user)
+    
+    await reply_text(
+        update.message,
+        f"💰 *Coin Balance*\n\n"
+        f"You have: {user_record['coins']} coins\n\n"
+        f"Earn more by:\n"
+        f"• Playing games 🎮\n"
+        f"• Leveling up ⬆️\n"
+        f"• Referring friends 👥\n"
+        f"• Daily activities 📅",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# ================== SHARE PAYLOADS ==================
+class BotIdentity:
+    """The bot's own account, resolved once in post_init"""
+    def __init__(self):
+        self.username = None
+
+    def resolve(self, bot):
+        # Application.initialize() already fetched getMe, so this makes no API call
+        self.username = bot.username
+        share_payload.cache_clear()
+
+bot_identity = BotIdentity()
+
+@functools.lru_cache(maxsize=10000)
+def share_payload(referral_code):
+    """Referral deep link, share text and inline share button for one user, built once"""
+    link = f"https://t.me/{bot_identity.username}?start={referral_code}"
+    share_text = (
+        f"🎮 *Check out PlayPal Bot!* 🤖\n\n"
+        f"An amazing Telegram bot with:\n"
+        f"• Fun games to play 🎯🎰\n"
+        f"• Viral memes and content 😂\n"
+        f"• Coin economy system 💰\n"
+        f"• Level progression 📊\n"
+        f"• AI chat capabilities 🤖\n\n"
+        f"Join the fun now: `{link}`"
+    )
+    share_url = "https://t.me/share/url?" + urlencode({
+        "url": link,
+        "text": "🎮 Play games, earn coins and level up with me on PlayPal!",
+    })
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("📤 Share with friends", url=share_url)]])
+    return link, share_text, markup
+
+async def cmd_refer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    user_record = ensure_user_record(user)
+    
+    referral_link, _, share_markup = share_payload(user_record['referral_code'])
+    
+    await reply_text(
+        update.message,
+        f"👥 *Referral Program*\n\n"
+        f"Share your link with friends:\n"
+        f"`{referral_link}`\n\n"
+        f"• You get 50 coins for each friend who joins\n"
+        f"• Your friend gets 50 bonus coins too!\n"
+        f"• Track your referrals with /profile\n\n"
+        f"Current referrals: {user_record['referrals']}",
+        reply_markup=share_markup,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# ================== COMMUNITY COMMANDS ==================
+async def cmd_community(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        f"👥 *Join Our Community!*\n\n"
+        f"📢 *Channel:* {CHANNEL_LINK}\n"
+        f"• Get updates about new features\n"
+        f"• See top players and winners\n\n"
+        f"💬 *Group:* {GROUP_LINK}\n"
+        f"• Chat with other players\n"
+        f"• Get help and support\n"
+        f"• Share your experiences\n\n"
+        f"Use the buttons below to join:",
+        reply_markup=social_menu_kb(),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def cmd_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        f"📢 *Join Our Channel!*\n\n"
+        f"Get updates about:\n"
+        f"• New games and features 🎮\n"
+        f"• Special events and contests 🎉\n"
+        f"• Top players and winners 🏆\n"
+        f"• Maintenance announcements ⚙️\n\n"
+        f"Click here to join: {CHANNEL_LINK}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def cmd_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        f"💬 *Join Our Community Group!*\n\n"
+        f"Connect with other players:\n"
+        f"• Get help and support 🤝\n"
+        f"• Share your experiences 💬\n"
+        f"• Suggest new features 💡\n"
+        f"• Participate in discussions 🗣️\n\n"
+        f"Click here to join: {GROUP_LINK}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def cmd_share(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_record = ensure_user_record(update.effective_user)
+    # The share text carries your own referral link; friends who start the bot with it credit you
+    _, share_text, share_markup = share_payload(user_record['referral_code'])
+    
+    await reply_text(
+        update.message,
+        f"🎉 *Share PlayPal with Friends!*\n\n"
+        f"Copy the message below and send it to your friends:",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    # Its own message, so it can be forwarded as-is
+    await reply_text(update.message, share_text, separate=True, reply_markup=share_markup, parse_mode=ParseMode.MARKDOWN)
+
+# ================== RATE LIMITING ==================
+class TokenBucket:
+    """Async token bucket; pause() stalls every waiter, e.g. after a RetryAfter"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now):
+        """Nobody waiting and refilled to capacity, so dropping it changes nothing"""
+        return (
+            not self._lock.locked()
+            and now >= self.paused_until
+            and self.tokens + (now - self.updated) * self.rate >= self.capacity
+        )
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+BACKGROUND = {"priority": PRIORITY_BACKGROUND}  # rate_limit_args for sends nobody is waiting on
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+class PriorityTokenBucket:
+    """Token bucket with one FIFO lane per priority; a token always goes to the
+    lowest-numbered lane with a waiter. Lanes can be paused independently."""
+    def __init__(self, rate, priorities, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lanes = {priority: deque() for priority in sorted(priorities)}
+        self.paused_until = dict.fromkeys(self.lanes, 0.0)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def pause(self, priority, seconds):
+        self.paused_until[priority] = max(self.paused_until[priority], time.monotonic() + seconds)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority):
+        now = time.monotonic()
+        if not any(self.lanes.values()) and now >= self.paused_until[priority]:
+            # Nobody queued: take a token directly instead of a round trip through _run
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+        future = asyncio.get_running_loop().create_future()
+        self.lanes[priority].append(future)
+        self.wakeup.set()
+        await future
+
+    def _next_lane(self, now):
+        for priority, lane in self.lanes.items():
+            while lane and lane[0].done():
+                lane.popleft()  # waiter was cancelled
+            if lane and now >= self.paused_until[priority]:
+                return lane
+        return None
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.monotonic()
+            lane = self._next_lane(now)
+            if lane is None:
+                # Sleep until a paused lane with waiters resumes, or a new waiter arrives
+                resumes = [t - now for p, t in self.paused_until.items() if t > now and self.lanes[p]]
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(resumes) if resumes else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._refill(now)
+            if self.tokens < 1:
+                # Re-pick afterwards: a more urgent waiter may arrive meanwhile
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            self.tokens -= 1
+            lane.popleft().set_result(None)
+
+class OutboundLimiter(BaseRateLimiter):
+    """Paces every Bot API call the application makes.
+
+    A call first waits on its chat's bucket (SEND_RATE_PRIVATE per second in
+    private chats, SEND_RATE_GROUP per minute in groups and channels), then on
+    the global SEND_RATE bucket, where interactive calls (the default) are
+    always served before background ones (rate_limit_args=BACKGROUND).
+    RetryAfter pauses the chat, or the whole lane for background traffic and
+    chat-less calls, and the call is retried up to SEND_MAX_RETRIES times.
+    """
+    MAX_IDLE_CHATS = 10000
+
+    def __init__(self):
+        self.global_bucket = PriorityTokenBucket(SEND_RATE, PRIORITY_NAMES)
+        self.chat_buckets = {}
+        self.waiting = dict.fromkeys(PRIORITY_NAMES, 0)
+
+    async def initialize(self):
+        if self.global_bucket.task is None:
+            self.global_bucket.start()
+
+    async def shutdown(self):
+        await self.global_bucket.stop()
+
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_IDLE_CHATS:
+                now = time.monotonic()
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle(now)}
+            # Groups and channels have negative ids (or an @username)
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(SEND_RATE_PRIVATE, capacity=3)
+            else:
+                bucket = TokenBucket(SEND_RATE_GROUP / 60, capacity=3)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+        lane = PRIORITY_NAMES[priority]
+        chat_id = data.get("chat_id")
+        chat_bucket = self.chat_bucket(chat_id) if chat_id is not None else None
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            started = time.monotonic()
+            self.waiting[priority] += 1
+            try:
+                if chat_bucket is not None:
+                    await chat_bucket.acquire()
+                await self.global_bucket.acquire(priority)
+            finally:
+                self.waiting[priority] -= 1
+            send_wait.observe(time.monotonic() - started, priority=lane)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                send_retry_after.inc(priority=lane, endpoint=endpoint)
+                if attempt == SEND_MAX_RETRIES:
+                    raise
+                print(f"{endpoint} hit flood control, retrying in {e.retry_after}s")
+                if chat_bucket is not None:
+                    chat_bucket.pause(e.retry_after)
+                if chat_bucket is None or priority == PRIORITY_BACKGROUND:
+                    self.global_bucket.pause(priority, e.retry_after)
+
+    def metrics(self):
+        metrics = {f"send_queue_{PRIORITY_NAMES[p]}": n for p, n in self.waiting.items()}
+        metrics["send_chat_buckets"] = len(self.chat_buckets)
+        return metrics
+
+outbound_limiter = OutboundLimiter()
+
+# ================== BROADCAST SYSTEM ==================
+class Broadcaster:
+    """Streams recipients from the user store page by page and sends through a
+    shared token bucket. Progress is checkpointed after every page so a restart
+    resumes from the last finished page (at most one page is re-sent).
+
+    Sends go out as background traffic, so outbound_limiter paces them
+    (and retries flood-controlled ones) behind interactive replies.
+    """
+    CHECKPOINT_KEY = "broadcast"
+
+    def __init__(self):
+        self.job = None
+        self.task = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    async def start(self, bot, admin_chat_id, text=None, from_chat_id=None, message_id=None):
+        # Make sure users created since the last flush are paged from the backend too
+        await user_store.flush()
+        self.job = {
+            "id": int(time.time()),
+            "admin_chat_id": admin_chat_id,
+            "text": text,
+            "from_chat_id": from_chat_id,
+            "message_id": message_id,
+            "cursor": 0,
+            "delivered": 0,
+            "blocked": 0,
+            "failed": 0,
+            "elapsed": 0.0,
+            "done": False,
+            "cancelled": False,
+        }
+        await user_store.save_meta(self.CHECKPOINT_KEY, self.job)
+        self.task = asyncio.create_task(self._run(bot))
+
+    async def resume(self, bot):
+        """Pick up an unfinished broadcast after a restart"""
+        job = await user_store.load_meta(self.CHECKPOINT_KEY)
+        if job and not job["done"]:
+            print(f"📣 Resuming broadcast {job['id']} after user {job['cursor']}")
+            self.job = job
+            self.task = asyncio.create_task(self._run(bot))
+
+    def cancel(self):
+        if self.running:
+            self.job["cancelled"] = True
+
+    async def stop(self):
+        """Interrupt on shutdown without marking the job done, so it resumes later"""
+        if self.running:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _deliver(self, bot, chat_id):
+        job = self.job
+        try:
+            if job["message_id"]:
+                await bot.copy_message(
+                    chat_id=chat_id, from_chat_id=job["from_chat_id"], message_id=job["message_id"],
+                    rate_limit_args=BACKGROUND
+                )
+            else:
+                await bot.send_message(chat_id=chat_id, text=job["text"], rate_limit_args=BACKGROUND)
+            return "delivered"
+        except Forbidden:
+            return "blocked"
+        except Exception as e:
+            print(f"Broadcast to {chat_id} failed: {e}")
+            return "failed"
+
+    async def _run(self, bot):
+        job = self.job
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+        async def send(chat_id):
+            async with semaphore:
+                outcome = await self._deliver(bot, chat_id)
+                job[outcome] += 1
+                broadcast_sends.inc(outcome=outcome)
+
+        while not job["cancelled"]:
+            page_started = time.monotonic()
+            page = await user_store.page_user_ids(job["cursor"], BROADCAST_PAGE_SIZE)
+            if not page:
+                break
+            await asyncio.gather(*(send(chat_id) for chat_id in page))
+            job["cursor"] = page[-1]
+            job["elapsed"] += time.monotonic() - page_started
+            await user_store.save_meta(self.CHECKPOINT_KEY, job)
+        job["done"] = True
+        await user_store.save_meta(self.CHECKPOINT_KEY, job)
+
+        try:
+            await bot.send_message(chat_id=job["admin_chat_id"], text=self.report(), parse_mode=ParseMode.MARKDOWN)
+        except Exception as e:
+            print(f"Failed to send broadcast report: {e}")
+
+    def report(self):
+        job = self.job
+        sent = job["delivered"] + job["blocked"] + job["failed"]
+        rate = sent / job["elapsed"] if job["elapsed"] else 0.0
+        if job["cancelled"]:
+            state = "🛑 Cancelled"
+        elif job["done"]:
+            state = "✅ Finished"
+        else:
+            state = "⏳ Running"
+        shard = f" (shard {SHARD_INDEX})" if SHARD_COUNT > 1 else ""
+        return (
+            f"📣 *Broadcast {job['id']}{shard}* — {state}\n\n"
+            f"• Processed: {sent} / ~{len(_users)} users\n"
+            f"• Delivered: {job['delivered']}\n"
+            f"• Blocked: {job['blocked']}\n"
+            f"• Failed: {job['failed']}\n"
+            f"• Throughput: {rate:.1f} msgs/sec"
+        )
+
+broadcaster = Broadcaster()
+
+# ================== SHARDING ==================
+def shard_of(user_id):
+    """Worker that owns a user's state: records, locks and open games"""
+    return user_id % SHARD_COUNT
+
+class ShardPeers:
+    """Calls RPC_METHODS on the other workers through their local /rpc route"""
+    def __init__(self):
+        self.session = None
+
+    async def start(self):
+        if SHARD_ROLE == "worker":
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET},
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def call(self, shard, method, params):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self.session.post(
+                f"http://127.0.0.1:{SHARD_BASE_PORT + shard}/rpc", json={"method": method, "params": params}
+            ) as resp:
+                resp.raise_for_status()
+                result = (await resp.json())["result"]
+            outcome = "ok"
+            return result
+        finally:
+            shard_rpc_latency.observe(time.perf_counter() - started, method=method, outcome=outcome)
+
+shard_peers = ShardPeers()
+
+async def call_shards(bot, method, params=None, shards=None):
+    """Run an RPC method on the given shards (default: all of them) and return
+    {shard: result}. This shard is called in-process and its errors propagate;
+    peers that fail are logged and left out of the result."""
+    params = params or {}
+    shards = list(range(SHARD_COUNT) if shards is None else shards)
+    if shards == [SHARD_INDEX]:
+        # Unsharded (or already on the owner): no task or round-trip needed
+        return {SHARD_INDEX: await RPC_METHODS[method](bot, params)}
+    results = await asyncio.gather(
+        *(RPC_METHODS[method](bot, params) if shard == SHARD_INDEX else shard_peers.call(shard, method, params)
+          for shard in shards),
+        return_exceptions=True,
+    )
+    replies = {}
+    for shard, result in zip(shards, results):
+        if isinstance(result, BaseException):
+            if shard == SHARD_INDEX:
+                raise result
+            print(f"⚠️ Shard {shard} did not answer {method}: {result}")
+        else:
+            replies[shard] = result
+    return replies
+
+def leaderboard_rows(field, k):
+    # Names travel with the rows since the other shards don't cache these users
+    return [[uid, value, _users[uid]["first_name"]] for uid, value in stats.leaderboards[field].top(k)]
+
+def merge_top(row_lists, k):
+    """Each shard's top k is exact for its users, so the top k of their union is global"""
+    return heapq.nlargest(k, (row for rows in row_lists for row in rows), key=lambda row: row[1])
+
+async def rpc_stats(bot, params):
+    """This shard's running totals and leaderboard tops"""
+    k = params.get("top", 10)
+    return {
+        "users": len(_users),
+        "daily_active": activity.active_users(1),
+        "weekly_active": activity.active_users(7),
+        "messages": stats.total_messages,
+        "games": stats.total_games,
+        "coins": stats.total_coins,
+        "leaderboards": {field: leaderboard_rows(field, k) for field in stats.leaderboards},
+    }
+
+async def rpc_leaderboard(bot, params):
+    return leaderboard_rows(params["field"], params.get("top", 10))
+
+async def rpc_credit_referral(bot, params):
+    """Pay the referral bonus to the owner of a code if they live on this shard.
+    No per_user lock: the referrer's own updates may hold it, and this only
+    makes the same unlocked increments referral credit always has."""
+    code = params["code"]
+    uid = find_referrer_id(code)
+    if uid is None:
+        referrer = await user_store.load_by_referral_code(code)
+        uid = referrer["user_id"] if referrer else None
+    if uid is not None:
+        add_coins(uid, 50)  # Referrer gets 50 coins
+        add_referral(uid)
+    return uid
+
+async def rpc_broadcast(bot, params):
+    """Start, cancel or report on this shard's part of a broadcast"""
+    action = params["action"]
+    if action == "start":
+        if broadcaster.running:
+            return None
+        await broadcaster.start(
+            bot, params["admin_chat_id"], text=params.get("text"),
+            from_chat_id=params.get("from_chat_id"), message_id=params.get("message_id")
+        )
+        return len(_users)
+    if action == "cancel":
+        broadcaster.cancel()
+        return True
+    return broadcaster.report() if broadcaster.job is not None else None
+
+RPC_METHODS = {
+    "stats": rpc_stats,
+    "leaderboard": rpc_leaderboard,
+    "credit_referral": rpc_credit_referral,
+    "broadcast": rpc_broadcast,
+}
+
+async def global_stats(bot, k=10):
+    """Totals and leaderboards summed over every shard that answered"""
+    replies = await call_shards(bot, "stats", {"top": k})
+    merged = {
+        key: sum(reply[key] for reply in replies.values())
+        for key in ("users", "daily_active", "weekly_active", "messages", "games", "coins")
+    }
+    merged["leaderboards"] = {
+        field: merge_top([reply["leaderboards"][field] for reply in replies.values()], k)
+        for field in stats.leaderboards
+    }
+    merged["shards"] = len(replies)
+    return merged
+
+async def global_leaderboard(bot, field, k=10):
+    replies = await call_shards(bot, "leaderboard", {"field": field, "top": k})
+    return merge_top(replies.values(), k)
+
+async def credit_referrer(bot, referral_code):
+    """Credit a referral on the shard that owns the referrer; returns their id or None"""
+    suffix = referral_code[4:]
+    shards = [shard_of(int(suffix))] if suffix.isdigit() else None
+    replies = await call_shards(bot, "credit_referral", {"code": referral_code}, shards)
+    return next((uid for uid in replies.values() if uid is not None), None)
+
+class ShardFront:
+    """The process started with SHARD_COUNT > 1. It spawns one worker per
+    shard (this same script with SHARD_ROLE=worker), restarts workers that
+    exit, and forwards every update to the worker owning its user. Updates
+    come from Telegram by webhook or, in polling mode, through getUpdates."""
+    FORWARD_DEADLINE = 30  # seconds to keep retrying a worker that is (re)starting
+
+    def __init__(self):
+        self.workers = {}  # shard -> asyncio.subprocess.Process
+        self.session = None
+        self.stopping = False
+
+    def shard_for(self, data):
+        """Route by the sending user, then by chat; anything else goes to shard 0"""
+        for key, value in data.items():
+            if key == "update_id" or not isinstance(value, dict):
+                continue
+            sender = value.get("from") or value.get("user")
+            if sender:
+                return shard_of(sender["id"])
+            if value.get("chat"):
+                return shard_of(value["chat"]["id"])
+        return 0
+
+    async def _supervise(self, shard):
+        env = dict(
+            os.environ, SHARD_ROLE="worker", SHARD_INDEX=str(shard), SHARD_COUNT=str(SHARD_COUNT),
+            SHARD_BASE_PORT=str(SHARD_BASE_PORT), PORT=str(SHARD_BASE_PORT + shard), WEBHOOK_SECRET=WEBHOOK_SECRET,
+        )
+        delay = 1
+        while not self.stopping:
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+            self.workers[shard] = proc
+            code = await proc.wait()
+            if self.stopping:
+                return
+            shard_restarts.inc(shard=shard)
+            # Back off while a worker keeps crashing on startup
+            delay = 1 if time.monotonic() - started > 60 else min(delay * 2, 30)
+            print(f"⚠️ Shard {shard} exited with code {code}, restarting in {delay}s")
+            await asyncio.sleep(delay)
 
-async def cmd_meme(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    meme = await content_system.get_viral_meme()
-    await update.message.reply_text(f"😂 *Viral Meme*\n\n*{meme['title']}*\nFrom: {meme['source']}")
-    await update.message.reply_photo(meme['url'])
+    async def forward(self, data):
+        """Hand an update to its shard; False if the worker never accepted it"""
+        shard = self.shard_for(data)
+        url = f"http://127.0.0.1:{SHARD_BASE_PORT + shard}/update"
+        deadline = time.monotonic() + self.FORWARD_DEADLINE
+        while True:
+            try:
+                async with self.session.post(url, json=data) as resp:
+                    if resp.status == 200:
+                        shard_forwarded.inc(shard=shard, outcome="ok")
+                        return True
+                    if resp.status == 400:
+                        # Malformed; redelivering it would fail the same way
+                        shard_forwarded.inc(shard=shard, outcome="rejected")
+                        return True
+                    error = f"HTTP {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if self.stopping or time.monotonic() > deadline:
+                shard_forwarded.inc(shard=shard, outcome="failed")
+                print(f"❌ Could not forward update {data.get('update_id')} to shard {shard}: {error}")
+                return False
+            await asyncio.sleep(0.5)
 
-async def cmd_surprise(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    surprise = await content_system.get_surprise_content()
-    
-    if surprise["type"] == "fact":
-        await update.message.reply_text(f"🎁 *Surprise Fact!* 🎁\n\n{surprise['content']}", parse_mode=ParseMode.MARKDOWN)
-    elif surprise["type"] == "quote":
-        await update.message.reply_text(f"🎁 *Surprise Quote!* 🎁\n\n{surprise['content']}", parse_mode=ParseMode.MARKDOWN)
-    elif surprise["type"] == "meme":
-        meme = surprise['content']
-        await update.message.reply_text(f"🎁 *Surprise Meme!* 🎁\n\n*{meme['title']}*\nFrom: {meme['source']}")
-        await update.message.reply_photo(meme['url'])
-    elif surprise["type"] == "joke":
-        await update.message.reply_text(f"🎁 *Surprise Joke!* 🎁\n\n{surprise['content']}")
-    elif surprise["type"] == "tip":
-        await update.message.reply_text(f"🎁 *Surprise Tip!* 🎁\n\n{surprise['content']}")
+    async def handle_update(self, request):
+        if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except Exception as e:
+            print(f"Rejected malformed update: {e}")
+            return web.Response(status=400)
+        # A non-2xx answer makes Telegram redeliver the update later
+        return web.Response(status=200 if await self.forward(data) else 503)
 
+    async def handle_health(self, request):
+        running = sum(proc.returncode is None for proc in self.workers.values())
+        return web.Response(text=f"✅ PlayPal shard front-end: {running}/{SHARD_COUNT} workers running")
 
-# ================== ECONOMY COMMANDS ==================
-async def cmd_coins(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    user_record = ensure_user_record(user)
-    
-    await update.message.reply_text(
-        f"💰 *Coin Balance*\n\n"
-        f"You have: {user_record['coins']} coins\n\n"
-        f"Earn more by:\n"
-        f"• Playing games 🎮\n"
-        f"• Leveling up ⬆️\n"
-        f"• Referring friends 👥\n"
-        f"• Daily activities 📅",
-        parse_mode=ParseMode.MARKDOWN
-    )
+    async def fetch_metrics(self, shard):
+        try:
+            async with self.session.get(f"http://127.0.0.1:{SHARD_BASE_PORT + shard}/metrics") as resp:
+                resp.raise_for_status()
+                return await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Could not scrape metrics from shard {shard}: {e!r}")
+            return None
 
-async def cmd_refer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    user_record = ensure_user_record(user)
-    
-    bot_username = (await context.bot.get_me()).username
-    referral_link = f"https://t.me/{bot_username}?start={user_record['referral_code']}"
-    
-    await update.message.reply_text(
-        f"👥 *Referral Program*\n\n"
-        f"Share your link with friends:\n"
-        f"`{referral_link}`\n\n"
-        f"• You get 50 coins for each friend who joins\n"
-        f"• Your friend gets 50 bonus coins too!\n"
-        f"• Track your referrals with /profile\n\n"
-        f"Current referrals: {user_record['referrals']}",
-        parse_mode=ParseMode.MARKDOWN
-    )
+    async def handle_metrics(self, request):
+        """The front-end's own metrics plus every reachable worker's, labelled
+        by shard, since the workers only listen on loopback"""
+        texts = await asyncio.gather(*(self.fetch_metrics(shard) for shard in range(SHARD_COUNT)))
+        sources = [(metrics_registry.render(), "")]
+        sources += [(text, f'shard="{shard}"') for shard, text in enumerate(texts) if text is not None]
+        return web.Response(text=merge_metrics(sources), content_type="text/plain")
 
-# ================== COMMUNITY COMMANDS ==================
-async def cmd_community(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        f"👥 *Join Our Community!*\n\n"
-        f"📢 *Channel:* {CHANNEL_LINK}\n"
-        f"• Get updates about new features\n"
-        f"• See top players and winners\n\n"
-        f"💬 *Group:* {GROUP_LINK}\n"
-        f"• Chat with other players\n"
-        f"• Get help and support\n"
-        f"• Share your experiences\n\n"
-        f"Use the buttons below to join:",
-        reply_markup=social_menu_kb(),
-        parse_mode=ParseMode.MARKDOWN
-    )
+    async def poll(self, bot):
+        """Long-poll getUpdates and forward in order; an update that can't be
+        forwarded is fetched again rather than skipped"""
+        await bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except Exception as e:
+                print(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                if not await self.forward(update.to_dict()):
+                    break
+                offset = update.update_id + 1
 
-async def cmd_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        f"📢 *Join Our Channel!*\n\n"
-        f"Get updates about:\n"
-        f"• New games and features 🎮\n"
-        f"• Special events and contests 🎉\n"
-        f"• Top players and winners 🏆\n"
-        f"• Maintenance announcements ⚙️\n\n"
-        f"Click here to join: {CHANNEL_LINK}",
-        parse_mode=ParseMode.MARKDOWN
-    )
+    async def run(self):
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
 
-async def cmd_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        f"💬 *Join Our Community Group!*\n\n"
-        f"Connect with other players:\n"
-        f"• Get help and support 🤝\n"
-        f"• Share your experiences 💬\n"
-        f"• Suggest new features 💡\n"
-        f"• Participate in discussions 🗣️\n\n"
-        f"Click here to join: {GROUP_LINK}",
-        parse_mode=ParseMode.MARKDOWN
-    )
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET},
+        )
+        supervisors = [asyncio.create_task(self._supervise(shard)) for shard in range(SHARD_COUNT)]
+        web_app = web.Application()
+        web_app.router.add_get("/", self.handle_health)
+        web_app.router.add_get("/metrics", self.handle_metrics)
+        if BOT_MODE == "webhook":
+            web_app.router.add_post(WEBHOOK_PATH, self.handle_update)
+        runner = web.AppRunner(web_app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", PORT).start()
+        print(f"🌐 Shard front-end listening on port {PORT}")
 
-async def cmd_share(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bot_username = (await context.bot.get_me()).username
-    share_text = (
-        f"🎮 *Check out PlayPal Bot!* 🤖\n\n"
-        f"An amazing Telegram bot with:\n"
-        f"• Fun games to play 🎯🎰\n"
-        f"• Viral memes and content 😂\n"
-        f"• Coin economy system 💰\n"
-        f"• Level progression 📊\n"
-        f"• AI chat capabilities 🤖\n\n"
-        f"Join the fun now: https://t.me/{bot_username}"
-    )
-    
-    await update.message.reply_text(
-        f"🎉 *Share PlayPal with Friends!*\n\n"
-        f"Copy the message below and send it to your friends:",
-        parse_mode=ParseMode.MARKDOWN
-    )
-    await update.message.reply_text(share_text, parse_mode=ParseMode.MARKDOWN)
+        bot = Bot(BOT_TOKEN, base_url=BOT_API_URL)
+        poller = None
+        try:
+            async with bot:
+                if BOT_MODE == "webhook":
+                    await bot.set_webhook(
+                        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                        secret_token=WEBHOOK_SECRET,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                    print(f"✅ Webhook set to {WEBHOOK_URL}{WEBHOOK_PATH}")
+                else:
+                    poller = asyncio.create_task(self.poll(bot))
+                await stop_event.wait()
+        finally:
+            self.stopping = True
+            if poller is not None:
+                poller.cancel()
+            await runner.cleanup()
+            # Workers flush their stores and checkpoint broadcasts on SIGTERM
+            for proc in self.workers.values():
+                if proc.returncode is None:
+                    proc.terminate()
+            await asyncio.gather(*(proc.wait() for proc in self.workers.values()))
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            await self.session.close()
+
+shard_front = ShardFront()
 
 # ================== ADMIN COMMANDS ==================
 async def cmd_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if not is_admin(user.id):
-        await update.message.reply_text("❌ Access denied. Admin only.")
+        await reply_text(update.message, "❌ Access denied. Admin only.")
         return
     
     admin_text = (
@@ -529,34 +2673,113 @@ async def cmd_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Total users: {len(_users)}"
     )
     
-    await update.message.reply_text(admin_text, parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, admin_text, parse_mode=ParseMode.MARKDOWN)
 
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if not is_admin(user.id):
-        await update.message.reply_text("❌ Access denied. Admin only.")
+        await reply_text(update.message, "❌ Access denied. Admin only.")
         return
     
-    total_users = len(_users)
-    total_messages = sum(user_data["messages"] for user_data in _users.values())
-    total_games = sum(user_data["games_played"] for user_data in _users.values())
-    total_coins = sum(user_data["coins"] for user_data in _users.values())
-    
-    # Find top 5 users by coins
-    top_users = sorted(_users.values(), key=lambda x: x["coins"], reverse=True)[:5]
-    top_users_text = "\n".join([f"{i+1}. {u['first_name']}: {u['coins']} coins" for i, u in enumerate(top_users)])
+    # Running totals and the top 5 by coins, summed across shards
+    totals = await global_stats(context.bot, 5)
+    top_users_text = "\n".join([f"{i+1}. {name}: {coins} coins" for i, (uid, coins, name) in enumerate(totals["leaderboards"]["coins"])])
     
     stats_text = (
         f"📊 *Bot Statistics*\n\n"
-        f"👥 Total users: {total_users}\n"
-        f"💬 Total messages: {total_messages}\n"
-        f"🎮 Total games played: {total_games}\n"
-        f"💰 Total coins in circulation: {total_coins}\n\n"
+        f"👥 Total users: {totals['users']}\n"
+        f"📅 Active today: {totals['daily_active']} | this week: {totals['weekly_active']}\n"
+        f"💬 Total messages: {totals['messages']}\n"
+        f"🎮 Total games played: {totals['games']}\n"
+        f"💰 Total coins in circulation: {totals['coins']}\n\n"
         f"🏆 *Top 5 Users by Coins:*\n"
         f"{top_users_text}"
     )
+    if SHARD_COUNT > 1:
+        stats_text += f"\n\n🧩 *Shards:* {totals['shards']}/{SHARD_COUNT} answered"
+    
+    pool = content_system.meme_pool.metrics()
+    stats_text += (
+        f"\n\n😂 *Meme pool:* {pool['meme_pool_size']} ready, "
+        f"{pool['meme_pool_hit_rate']:.0%} hit rate, "
+        f"refill {pool['meme_refill_latency_seconds'] * 1000:.0f}ms"
+    )
+    
+    await reply_text(update.message, stats_text, parse_mode=ParseMode.MARKDOWN)
+
+LEADERBOARD_TITLES = {
+    "coins": ("💰 Coins", "coins"),
+    "xp": ("📊 XP", "XP"),
+    "referrals": ("👥 Referrals", "referrals"),
+}
+
+async def cmd_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    field = context.args[0].lower() if context.args else "coins"
+    if field not in LEADERBOARD_TITLES:
+        await reply_text(update.message, "Usage: /leaderboard [coins|xp|referrals]")
+        return
+    
+    title, label = LEADERBOARD_TITLES[field]
+    rows = await global_leaderboard(context.bot, field)
+    if rows:
+        board_text = "\n".join([f"{i+1}. {name}: {value} {label}" for i, (uid, value, name) in enumerate(rows)])
+    else:
+        board_text = "No players yet. Be the first! 🚀"
+    
+    await reply_text(
+        update.message,
+        f"🏆 *Leaderboard — {title}*\n\n{board_text}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if not is_admin(user.id):
+        await reply_text(update.message, "❌ Access denied. Admin only.")
+        return
+    
+    # Every shard broadcasts to its own users and reports on its own.
+    # Subcommands must stand alone so messages like "Cancel tonight's ..." still send
+    action = context.args[0].lower() if len(context.args or ()) == 1 else ""
+    if action == "status":
+        reports = [report for report in (await call_shards(context.bot, "broadcast", {"action": "status"})).values() if report]
+        if not reports:
+            await reply_text(update.message, "No broadcast has been started yet.")
+        else:
+            await reply_text(update.message, "\n\n".join(reports), parse_mode=ParseMode.MARKDOWN)
+        return
+    if action == "cancel":
+        await call_shards(context.bot, "broadcast", {"action": "cancel"})
+        await reply_text(update.message, "🛑 Broadcast will stop after the current page.")
+        return
     
-    await update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN)
+    replied = update.message.reply_to_message
+    if replied:
+        # Copy the replied-to message so media and formatting are preserved
+        job = {"from_chat_id": replied.chat_id, "message_id": replied.message_id}
+    elif context.args:
+        job = {"text": update.message.text.split(None, 1)[1]}
+    else:
+        await reply_text(
+            update.message,
+            "Usage:\n"
+            "/broadcast <message> - Send a message to all users\n"
+            "Reply to a message with /broadcast - Copy it to all users\n"
+            "/broadcast status - Show progress\n"
+            "/broadcast cancel - Stop the running broadcast"
+        )
+        return
+    
+    job.update(action="start", admin_chat_id=update.effective_chat.id)
+    started = [users for users in (await call_shards(context.bot, "broadcast", job)).values() if users is not None]
+    if not started:
+        await reply_text(update.message, "⏳ A broadcast is already running. Use /broadcast status or /broadcast cancel.")
+        return
+    
+    notice = f"📣 Broadcast started to ~{sum(started)} users.\n"
+    if len(started) < SHARD_COUNT:
+        notice += f"⚠️ Only {len(started)}/{SHARD_COUNT} shards started; the others are busy or unreachable.\n"
+    await reply_text(update.message, notice + "Use /broadcast status to follow progress.")
 
 # ================== VIRAL COMMAND HANDLERS ==================
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -567,7 +2790,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     referral_bonus = await handle_referral_start(update, context)
     
     welcome_gift = 50
-    user_record["coins"] += welcome_gift
+    add_coins(user.id, welcome_gift)
     
     name = user.first_name or "friend"
     admin_status = " 👑" if user_record["is_admin"] else ""
@@ -601,7 +2824,8 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     text += "Use the menu below to explore! 👇"
     
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         text, 
         reply_markup=main_menu_kb(), 
         parse_mode=ParseMode.MARKDOWN
@@ -611,18 +2835,21 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "🤖 *PlayPal Ultimate Bot Help*\n\n"
         "🎮 *Games:*\n"
-        "• /quiz - Trivia quiz game\n"
+        "• /quiz - Trivia quiz game (e.g. /quiz hard science)\n"
         "• /slots - Slot machine game\n"
         "• /dice - Roll dice for rewards\n\n"
         "😂 *Fun Commands:*\n"
         "• /fact - Interesting daily fact\n"
         "• /quote - Motivational quote\n"
         "• /meme - Get a viral meme\n"
-        "• /surprise - Random surprise content\n\n"
+        "• /surprise - Random surprise content\n"
+        "• /news - Top headlines\n"
+        "• /gif - Trending GIF\n\n"
         "📊 *Profile:*\n"
         "• /profile - View your stats\n"
         "• /coins - Check your balance\n"
-        "• /refer - Get referral link\n\n"
+        "• /refer - Get referral link\n"
+        "• /leaderboard - Top players\n\n"
         "👥 *Community:*\n"
         "• /community - Join channel & group\n"
         "• /channel - Our official channel\n"
@@ -647,7 +2874,7 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     help_text += "Use the keyboard menu for easy navigation! 🎯"
     
-    await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, help_text, parse_mode=ParseMode.MARKDOWN)
 
 async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -669,43 +2896,111 @@ async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_record["is_admin"]:
         profile_text += "👑 *Bot Admin*\n\n"
     
-    profile_text += f"Joined: {user_record['joined_at'].strftime('%Y-%m-%d')}\n\n"
+    joined_at = datetime.fromtimestamp(user_record['joined_at'], timezone.utc)
+    profile_text += f"Joined: {joined_at.strftime('%Y-%m-%d')}\n\n"
     profile_text += f"🔗 *Community Links:*\nChannel: {CHANNEL_LINK}\nGroup: {GROUP_LINK}"
     
-    await update.message.reply_text(profile_text, parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, profile_text, parse_mode=ParseMode.MARKDOWN)
 
 # ================== CONTACT ADMIN SYSTEM ==================
-async def cmd_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle contact admin requests"""
-    user = update.effective_user
-    user_record = ensure_user_record(user)
-    
-    message = " ".join(context.args) if context.args else "I would like to get help"
-    
-    contact_text = (
-        f"📩 *Contact Request*\n\n"
+class AdminNotifier:
+    """Queues admin notifications and delivers them from a background task.
+
+    Notifications arriving within ADMIN_DIGEST_WINDOW seconds are merged into a
+    single digest, and each batch goes to all admins concurrently as background
+    traffic, so users get their acknowledgement immediately.
+    """
+    MAX_MESSAGE_LENGTH = 4000
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def notify(self, text):
+        if not ADMIN_IDS:
+            return False
+        self.queue.put_nowait(text)
+        return True
+
+    def start(self, bot):
+        self.task = asyncio.create_task(self._run(bot))
+
+    async def stop(self, bot):
+        """Stop the worker and deliver whatever is still queued"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self._dispatch(bot, self._drain([]))
+
+    def _drain(self, batch):
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self, bot):
+        while True:
+            batch = [await self.queue.get()]
+            # Give a burst (e.g. a raid of @admin mentions) time to pile up
+            await asyncio.sleep(ADMIN_DIGEST_WINDOW)
+            await self._dispatch(bot, self._drain(batch))
+
+    async def _dispatch(self, bot, batch):
+        if not batch:
+            return
+        for text in self._digest(batch):
+            await asyncio.gather(*(self._send(bot, admin_id, text) for admin_id in ADMIN_IDS))
+
+    def _digest(self, batch):
+        if len(batch) == 1:
+            return batch
+        header = f"📬 *Admin Digest* — {len(batch)} notifications\n\n"
+        separator = "\n\n➖➖➖➖➖\n\n"
+        chunks, current = [], header
+        for text in batch:
+            if current != header and len(current) + len(separator) + len(text) > self.MAX_MESSAGE_LENGTH:
+                chunks.append(current)
+                current = header
+            current += (separator if current != header else "") + text
+        chunks.append(current)
+        return chunks
+
+    async def _send(self, bot, admin_id, text):
+        parse_mode = ParseMode.MARKDOWN
+        while True:
+            try:
+                await bot.send_message(chat_id=admin_id, text=text, parse_mode=parse_mode, rate_limit_args=BACKGROUND)
+                return
+            except BadRequest as e:
+                if parse_mode is None:
+                    print(f"Failed to send to admin {admin_id}: {e}")
+                    return
+                # User-supplied text can break Markdown; resend it as plain text
+                parse_mode = None
+            except Exception as e:
+                print(f"Failed to send to admin {admin_id}: {e}")
+                return
+
+admin_notifier = AdminNotifier()
+
+def format_admin_notice(title, user, message):
+    return (
+        f"📩 *{title}*\n\n"
         f"• From: {user.first_name} (@{user.username or 'No username'})\n"
         f"• User ID: `{user.id}`\n"
         f"• Message: {message}\n\n"
         f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
+
+async def cmd_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle contact admin requests"""
+    user = update.effective_user
+    user_record = ensure_user_record(user)
     
-    # Send to all admins
-    sent_count = 0
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=contact_text,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            sent_count += 1
-            # Avoid rate limiting
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            print(f"Failed to send to admin {admin_id}: {e}")
+    message = " ".join(context.args) if context.args else "I would like to get help"
     
-    if sent_count > 0:
+    # Queue for all admins; delivery happens in the background
+    if admin_notifier.notify(format_admin_notice("Contact Request", user, message)):
         response = (
             "✅ *Message sent to admins!*\n\n"
             "Our team will contact you shortly. "
@@ -719,7 +3014,7 @@ async def cmd_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"{GROUP_LINK}"
         )
     
-    await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
+    await reply_text(update.message, response, parse_mode=ParseMode.MARKDOWN)
 
 async def handle_admin_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle @admin mentions in messages"""
@@ -728,68 +3023,259 @@ async def handle_admin_mention(update: Update, context: ContextTypes.DEFAULT_TYP
     
     user_message = update.message.text
     
-    # Check if message contains @admin
-    if "@admin" in user_message.lower():
-        contact_text = (
-            f"📩 *Admin Mention*\n\n"
-            f"• From: {user.first_name} (@{user.username or 'No username'})\n"
-            f"• User ID: `{user.id}`\n"
-            f"• Message: {user_message}\n\n"
-            f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    if admin_notifier.notify(format_admin_notice("Admin Mention", user, user_message)):
+        response = (
+            "👋 *Hi! I see you mentioned @admin*\n\n"
+            "Your message has been forwarded to our admin team. "
+            "They'll contact you soon!\n\n"
+            "For faster support, you can:\n"
+            f"• Use /contact <message>\n"
+            f"• Join our group: {GROUP_LINK}\n"
+            f"• Check /help for common questions"
+        )
+    else:
+        response = (
+            "👋 *Hi! I see you mentioned @admin*\n\n"
+            "Sorry, we couldn't reach our admin team right now. "
+            "Please try:\n"
+            f"• Using /contact <message>\n"
+            f"• Joining our group: {GROUP_LINK}\n"
+            f"• Checking /help for quick answers"
         )
-        
-        # Send to all admins
-        sent_count = 0
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=contact_text,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                sent_count += 1
-                # Avoid rate limiting
-                await asyncio.sleep(0.1)
-            except Exception as e:
-                print(f"Failed to send to admin {admin_id}: {e}")
-        
-        if sent_count > 0:
-            response = (
-                "👋 *Hi! I see you mentioned @admin*\n\n"
-                "Your message has been forwarded to our admin team. "
-                "They'll contact you soon!\n\n"
-                "For faster support, you can:\n"
-                f"• Use /contact <message>\n"
-                f"• Join our group: {GROUP_LINK}\n"
-                f"• Check /help for common questions"
-            )
-        else:
-            response = (
-                "👋 *Hi! I see you mentioned @admin*\n\n"
-                "Sorry, we couldn't reach our admin team right now. "
-                "Please try:\n"
-                f"• Using /contact <message>\n"
-                f"• Joining our group: {GROUP_LINK}\n"
-                f"• Checking /help for quick answers"
-            )
-        
-        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
-        return True
     
-    return False
+    await reply_text(update.message, response, parse_mode=ParseMode.MARKDOWN)
+
+
+# ================== MESSAGE ROUTING ==================
+class KeywordMatcher:
+    """Aho-Corasick automaton over intent keywords.
+
+    One pass over the message finds every keyword occurrence, so the cost
+    depends on the message length rather than on how many intents exist.
+    match() returns the priority of the best (lowest-numbered) intent found.
+    """
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [None]
+        self.best = [None]
+        self.stale = False
+
+    def add(self, keyword, priority):
+        state = 0
+        for ch in keyword:
+            if ch not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+                self.best.append(None)
+                self.goto[state][ch] = len(self.goto) - 1
+            state = self.goto[state][ch]
+        if self.out[state] is None or priority < self.out[state]:
+            self.out[state] = priority
+        self.stale = True
+
+    def build(self):
+        """Recompute failure links breadth-first after keywords were added"""
+        self.stale = False
+        self.best[0] = self.out[0]
+        queue = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            fallback = self.best[self.fail[state]]
+            own = self.out[state]
+            self.best[state] = own if fallback is None or (own is not None and own < fallback) else fallback
+            for ch, child in self.goto[state].items():
+                link = self.fail[state]
+                while link and ch not in self.goto[link]:
+                    link = self.fail[link]
+                self.fail[child] = self.goto[link].get(ch, 0)
+                queue.append(child)
+
+    def match(self, text):
+        if self.stale:
+            self.build()
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            priority = best[state]
+            if priority is not None and (found is None or priority < found):
+                found = priority
+                if found == 0:
+                    break
+        return found
+
+_intent_handlers = []
+_intent_matcher = KeywordMatcher()
+
+def intent(*keywords):
+    """Register a free-text intent; when several match, the earliest registered wins"""
+    def decorator(func):
+        priority = len(_intent_handlers)
+        _intent_handlers.append(func)
+        for keyword in keywords:
+            _intent_matcher.add(keyword.lower(), priority)
+        return func
+    return decorator
+
+def match_intent(text):
+    priority = _intent_matcher.match(text.lower())
+    return _intent_handlers[priority] if priority is not None else None
+
+intent("@admin")(handle_admin_mention)
+
+@intent("hello", "hi", "hey", "hola")
+async def intent_greeting(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, f"👋 Hello {update.effective_user.first_name}! How can I help you today?")
+
+@intent("how are you", "how you doing")
+async def intent_how_are_you(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "I'm doing great! Ready to play some games? 🎮")
+
+@intent("thank", "thanks", "thank you")
+async def intent_thanks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "You're welcome! 😊")
+
+@intent("joke", "funny")
+async def intent_joke(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "Why don't scientists trust atoms? Because they make up everything! 😂")
+
+@intent("what can you do", "features")
+async def intent_features(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await cmd_help(update, context)
+
+@intent("admin", "help", "support")
+async def intent_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        "Need admin help? You can:\n"
+        "• Mention @admin in any message\n"
+        "• Use /contact <your message>\n"
+        f"• Join our group: {GROUP_LINK}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@intent("channel", "group", "community")
+async def intent_community(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await cmd_community(update, context)
 
+async def reply_default(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        "I'm here to chat and play games with you! "
+        "Need admin help? Mention @admin 👇", 
+        reply_markup=main_menu_kb()
+    )
+
+# ================== MENU BUTTONS ==================
+async def menu_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "🎮 Choose a game:", reply_markup=games_menu_kb())
+
+async def menu_fun(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "😂 Choose fun content:", reply_markup=fun_menu_kb())
+
+async def menu_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        "⭐ *Premium Features*\n\n"
+        "Coming soon! Premium members will get:\n"
+        "• Exclusive games\n"
+        "• Daily bonus coins\n"
+        "• Ad-free experience\n"
+        "• Priority support\n\n"
+        "Contact admins using /contact or mention @admin",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def menu_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        "🤖 *AI Chat*\n\n"
+        "I'm here to chat! Try asking me:\n"
+        "• How are you?\n"
+        "• Tell me a joke\n"
+        "• What can you do?\n"
+        "• Play a game with me\n\n"
+        "Need admin help? Mention @admin",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def menu_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update.message,
+        "📞 *Support*\n\n"
+        "Need help? Here's how to reach us:\n"
+        "• Mention @admin in any message\n"
+        "• Use /contact <your message>\n"
+        f"• Join our group: {GROUP_LINK}\n\n"
+        "We're here to help! 💖",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def menu_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "Use /slots <amount> to play slot machine!")
+
+async def menu_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update.message, "Back to main menu:", reply_markup=main_menu_kb())
+
+MENU_ROUTES = {
+    "🎮 Games": menu_games,
+    "😂 Fun": menu_fun,
+    "📊 Profile": cmd_profile,
+    "⭐ Premium": menu_premium,
+    "🤖 AI Chat": menu_ai_chat,
+    "📞 Support": menu_support,
+    "🎯 Quiz": cmd_quiz,
+    "🎰 Slots": menu_slots,
+    "📰 Daily Fact": cmd_fact,
+    "💬 Quote": cmd_quote,
+    "😂 Meme": cmd_meme,
+    "🎁 Surprise": cmd_surprise,
+    "🗞 News": cmd_news,
+    "🎞 GIF": cmd_gif,
+    "📢 Join Channel": cmd_channel,
+    "👥 Join Group": cmd_group,
+    "🎉 Share Bot": cmd_share,
+    "⬅️ Back": menu_back,
+}
+
+# ================== CALLBACK BUTTONS ==================
+# callback_data is "<prefix>:<field>:..."; the prefix picks the handler, which
+# receives the fields as positional arguments
+CALLBACK_ROUTES = {
+    "q": (handle_quiz_callback, 2),  # q:<game token>:<option index>
+}
+
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    prefix, *fields = (query.data or "").split(":")
+    handler, field_count = CALLBACK_ROUTES.get(prefix, (None, 0))
+    if handler is None or len(fields) != field_count or query.message is None:
+        # Unknown or malformed, e.g. buttons left over from an older layout
+        await query.answer("This button is no longer valid.")
+        return
+    async with track_handler(handler.__name__, "callback"):
+        await handler(update, context, *fields)
 
 # ================== MESSAGE HANDLERS ==================
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message and update.message.text:
         user = update.effective_user
-        user_record = ensure_user_record(user)
-        user_record["messages"] += 1
+        ensure_user_record(user)
+        record_message(user.id)
         
         # Add XP for messaging
         leveled_up, new_level = add_xp(user.id, 1)
         if leveled_up:
-            await update.message.reply_text(
+            await reply_text(
+                update.message,
                 f"🎉 *Level Up!* 🎉\n\n"
                 f"You reached level {new_level}!\n"
                 f"+{new_level * 10} coins reward!",
@@ -797,107 +3283,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         
         user_message = update.message.text
-        chat_id = update.effective_chat.id
-        game_id = f"{chat_id}_{user.id}"
-        
-        # Check if user has an active quiz first
-        if game_id in _active_games and _active_games[game_id]["type"] == "quiz":
-            await handle_quiz_answer(update, context)
-            return
         
-        # Check for @admin mention
-        if await handle_admin_mention(update, context):
-            return
-        
-        # Handle menu options
-        if user_message == "🎮 Games":
-            await update.message.reply_text("🎮 Choose a game:", reply_markup=games_menu_kb())
-        elif user_message == "😂 Fun":
-            await update.message.reply_text("😂 Choose fun content:", reply_markup=fun_menu_kb())
-        elif user_message == "📊 Profile":
-            await cmd_profile(update, context)
-        elif user_message == "⭐ Premium":
-            await update.message.reply_text(
-                "⭐ *Premium Features*\n\n"
-                "Coming soon! Premium members will get:\n"
-                "• Exclusive games\n"
-                "• Daily bonus coins\n"
-                "• Ad-free experience\n"
-                "• Priority support\n\n"
-                "Contact admins using /contact or mention @admin",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        elif user_message == "🤖 AI Chat":
-            await update.message.reply_text(
-                "🤖 *AI Chat*\n\n"
-                "I'm here to chat! Try asking me:\n"
-                "• How are you?\n"
-                "• Tell me a joke\n"
-                "• What can you do?\n"
-                "• Play a game with me\n\n"
-                "Need admin help? Mention @admin",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        elif user_message == "📞 Support":
-            await update.message.reply_text(
-                "📞 *Support*\n\n"
-                "Need help? Here's how to reach us:\n"
-                "• Mention @admin in any message\n"
-                "• Use /contact <your message>\n"
-                "• Join our group: {GROUP_LINK}\n\n"
-                "We're here to help! 💖",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        elif user_message == "🎯 Quiz":
-            await cmd_quiz(update, context)
-        elif user_message == "🎰 Slots":
-            await update.message.reply_text("Use /slots <amount> to play slot machine!")
-        elif user_message == "📰 Daily Fact":
-            await cmd_fact(update, context)
-        elif user_message == "💬 Quote":
-            await cmd_quote(update, context)
-        elif user_message == "😂 Meme":
-            await cmd_meme(update, context)
-        elif user_message == "🎁 Surprise":
-            await cmd_surprise(update, context)
-        elif user_message == "📢 Join Channel":
-            await cmd_channel(update, context)
-        elif user_message == "👥 Join Group":
-            await cmd_group(update, context)
-        elif user_message == "🎉 Share Bot":
-            await cmd_share(update, context)
-        elif user_message == "⬅️ Back":
-            await update.message.reply_text("Back to main menu:", reply_markup=main_menu_kb())
-        else:
-            # AI-like responses
-            if any(word in user_message.lower() for word in ["hello", "hi", "hey", "hola"]):
-                await update.message.reply_text(f"👋 Hello {user.first_name}! How can I help you today?")
-            elif any(word in user_message.lower() for word in ["how are you", "how you doing"]):
-                await update.message.reply_text("I'm doing great! Ready to play some games? 🎮")
-            elif any(word in user_message.lower() for word in ["thank", "thanks", "thank you"]):
-                await update.message.reply_text("You're welcome! 😊")
-            elif any(word in user_message.lower() for word in ["joke", "funny"]):
-                await update.message.reply_text("Why don't scientists trust atoms? Because they make up everything! 😂")
-            elif any(word in user_message.lower() for word in ["what can you do", "features"]):
-                await cmd_help(update, context)
-            elif any(word in user_message.lower() for word in ["admin", "help", "support"]):
-                await update.message.reply_text(
-                    "Need admin help? You can:\n"
-                    "• Mention @admin in any message\n"
-                    "• Use /contact <your message>\n"
-                    "• Join our group: {GROUP_LINK}",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif any(word in user_message.lower() for word in ["channel", "group", "community"]):
-                await cmd_community(update, context)
-            else:
-                await update.message.reply_text(
-                    "I'm here to chat and play games with you! "
-                    "Need admin help? Mention @admin 👇", 
-                    reply_markup=main_menu_kb()
-                )
+        # Menu buttons are exact matches, everything else goes through the intent matcher
+        handler, via = MENU_ROUTES.get(user_message), "menu"
+        if handler is None:
+            handler, via = match_intent(user_message) or reply_default, "intent"
+        async with track_handler(handler.__name__, via):
+            await handler(update, context)
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    errors_total.inc(error=type(context.error).__name__)
     print(f"Error: {context.error}")
     try:
         if update and hasattr(update, 'effective_chat'):
@@ -908,65 +3303,216 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
 
-# ================== CLEANUP TASKS ==================
-async def cleanup_old_quizzes():
-    """Clean up quizzes that are older than 10 minutes"""
-    while True:
+# ================== HTTP SERVER ==================
+def collect_metrics():
+    """Point-in-time gauges exported on /metrics"""
+    metrics = {
+        "users": len(_users),
+        "daily_active_users": activity.active_users(1),
+        "weekly_active_users": activity.active_users(7),
+        "active_games": len(_active_games),
+        "messages_total": stats.total_messages,
+        "games_played_total": stats.total_games,
+        "coins_in_circulation": stats.total_coins,
+        "admin_notify_queue_depth": admin_notifier.queue.qsize(),
+        "game_expiry_heap_size": len(game_expiry.heap),
+        "file_id_cache_size": len(file_id_cache.entries),
+    }
+    metrics.update(content_system.meme_pool.metrics())
+    metrics.update(content_system.feed_metrics())
+    metrics.update(outbound_limiter.metrics())
+    return metrics
+
+def render_metrics():
+    gauges = "".join(
+        f"# TYPE playpal_{name} gauge\nplaypal_{name} {value}\n" for name, value in collect_metrics().items()
+    )
+    return gauges + metrics_registry.render()
+
+class WebServer:
+    """Single aiohttp server on PORT for the health check, metrics and, in
+    webhook mode, Telegram updates. Shard workers take their updates from the
+    front-end on /update and serve cross-shard calls on /rpc."""
+    def __init__(self):
+        self.runner = None
+
+    async def start(self, application, webhook=False):
+        web_app = web.Application()
+        web_app["application"] = application
+        web_app.router.add_get("/", self.handle_health)
+        web_app.router.add_get("/metrics", self.handle_metrics)
+        if webhook:
+            web_app.router.add_post(UPDATE_PATH, self.handle_update)
+        if SHARD_ROLE == "worker":
+            web_app.router.add_post("/rpc", self.handle_rpc)
+        self.runner = web.AppRunner(web_app, access_log=None)
+        await self.runner.setup()
+        # Workers are only reached by the front-end and each other, never from outside
+        host = "127.0.0.1" if SHARD_ROLE == "worker" else "0.0.0.0"
+        await web.TCPSite(self.runner, host, PORT).start()
+        print(f"🌐 HTTP server listening on {host}:{PORT}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_health(self, request):
+        return web.Response(text="✅ PlayPal Ultimate Bot is running!")
+
+    async def handle_metrics(self, request):
+        return web.Response(text=render_metrics(), content_type="text/plain")
+
+    async def handle_update(self, request):
+        if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=403)
+        application = request.app["application"]
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            print(f"Rejected malformed update: {e}")
+            return web.Response(status=400)
+        # Ack right away; the application processes the queue in the background
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_rpc(self, request):
+        """Cross-shard calls from the other workers (see RPC_METHODS)"""
+        if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=403)
         try:
-            current_time = datetime.now()
-            expired_quizzes = []
-            
-            for game_id, game_data in _active_games.items():
-                if game_data["type"] == "quiz":
-                    time_diff = (current_time - game_data["start_time"]).total_seconds()
-                    if time_diff > 600:  # 10 minutes
-                        expired_quizzes.append(game_id)
-            
-            for game_id in expired_quizzes:
-                del _active_games[game_id]
-                print(f"Cleaned up expired quiz: {game_id}")
-                
-            await asyncio.sleep(300)  # Check every 5 minutes
-            
+            body = await request.json()
+            name, params = body["method"], body.get("params") or {}
         except Exception as e:
-            print(f"Error in quiz cleanup: {e}")
-            await asyncio.sleep(60)
+            print(f"Rejected malformed RPC call: {e}")
+            return web.Response(status=400)
+        method = RPC_METHODS.get(name)
+        if method is None:
+            return web.Response(status=404)
+        try:
+            result = await method(request.app["application"].bot, params)
+        except Exception as e:
+            print(f"RPC {name} failed: {e}")
+            return web.Response(status=500)
+        return web.json_response({"result": result})
+
+web_server = WebServer()
 
 # ================== BOT SETUP ==================
-def main():
-    # Create the Application
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
-
-    # Add handlers
-    application.add_handler(CommandHandler("start", cmd_start))
-    application.add_handler(CommandHandler("help", cmd_help))
-    application.add_handler(CommandHandler("profile", cmd_profile))
-    application.add_handler(CommandHandler("quiz", cmd_quiz))
-    application.add_handler(CommandHandler("slots", cmd_slots))
-    application.add_handler(CommandHandler("fact", cmd_fact))
-    application.add_handler(CommandHandler("quote", cmd_quote))
-    application.add_handler(CommandHandler("meme", cmd_meme))
-    application.add_handler(CommandHandler("surprise", cmd_surprise))
-    application.add_handler(CommandHandler("coins", cmd_coins))
-    application.add_handler(CommandHandler("refer", cmd_refer))
-    application.add_handler(CommandHandler("contact", cmd_contact))
-    application.add_handler(CommandHandler("admin", cmd_admin))
-    application.add_handler(CommandHandler("stats", cmd_stats))
-    application.add_handler(CommandHandler("community", cmd_community))
-    application.add_handler(CommandHandler("channel", cmd_channel))
-    application.add_handler(CommandHandler("group", cmd_group))
-    application.add_handler(CommandHandler("share", cmd_share))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+async def post_init(application):
+    # Warm the user cache before the first update is processed
+    await user_store.open(make_user_backend())
+    await http_client.start()
+    bot_identity.resolve(application.bot)
+    await web_server.start(application, webhook=PUSH_UPDATES)
+    await shard_peers.start()
+    await file_id_cache.load()
+    await asyncio.to_thread(trivia_bank.load, TRIVIA_BANK_PATH)
+    await broadcaster.resume(application.bot)
+    admin_notifier.start(application.bot)
+    content_system.start()
+    game_expiry.start(application.bot)
+
+async def post_stop(application):
+    # The bot can still send here; it is shut down right after
+    await broadcaster.stop()
+    await admin_notifier.stop(application.bot)
+    await content_system.stop()
+    await game_expiry.stop()
+
+async def post_shutdown(application):
+    await web_server.stop()
+    await http_client.close()
+    await shard_peers.close()
+    await file_id_cache.save()
+    trivia_bank.close()
+    await user_store.close()
+
+def build_application(request=None):
+    """`request` replaces the Bot API HTTP backend (e.g. benchmarks/loadtest.py's fake)"""
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_URL)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .request(request or InstrumentedRequest(connection_pool_size=256))
+        .rate_limiter(outbound_limiter)
+    )
+    if PUSH_UPDATES:
+        # Updates arrive through web_server, so no getUpdates poller is needed
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Count every update before any handler runs
+    application.add_handler(TypeHandler(Update, count_update), group=-1)
+
+    # Add handlers; economy handlers run under per_user so one user's
+    # updates stay ordered while other users are processed in parallel.
+    # Menu buttons, intents and callback buttons are timed by their dispatcher.
+    application.add_handler(CommandHandler("start", per_user(instrumented(cmd_start))))
+    application.add_handler(CommandHandler("help", instrumented(cmd_help)))
+    application.add_handler(CommandHandler("profile", instrumented(cmd_profile)))
+    application.add_handler(CommandHandler("quiz", per_user(instrumented(cmd_quiz))))
+    application.add_handler(CommandHandler("slots", per_user(instrumented(cmd_slots))))
+    application.add_handler(CommandHandler("fact", instrumented(cmd_fact)))
+    application.add_handler(CommandHandler("quote", instrumented(cmd_quote)))
+    application.add_handler(CommandHandler("meme", instrumented(cmd_meme)))
+    application.add_handler(CommandHandler("surprise", instrumented(cmd_surprise)))
+    application.add_handler(CommandHandler("news", instrumented(cmd_news)))
+    application.add_handler(CommandHandler("gif", instrumented(cmd_gif)))
+    application.add_handler(CommandHandler("coins", instrumented(cmd_coins)))
+    application.add_handler(CommandHandler("refer", instrumented(cmd_refer)))
+    application.add_handler(CommandHandler("contact", instrumented(cmd_contact)))
+    application.add_handler(CommandHandler("admin", instrumented(cmd_admin)))
+    application.add_handler(CommandHandler("stats", instrumented(cmd_stats)))
+    application.add_handler(CommandHandler("leaderboard", instrumented(cmd_leaderboard)))
+    application.add_handler(CommandHandler("broadcast", instrumented(cmd_broadcast)))
+    application.add_handler(CommandHandler("community", instrumented(cmd_community)))
+    application.add_handler(CommandHandler("channel", instrumented(cmd_channel)))
+    application.add_handler(CommandHandler("group", instrumented(cmd_group)))
+    application.add_handler(CommandHandler("share", instrumented(cmd_share)))
+    application.add_handler(CallbackQueryHandler(per_user(handle_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, per_user(coalesce_replies(handle_message))))
     application.add_error_handler(error_handler)
+    return application
+
+async def run_webhook(application, set_webhook=True):
+    """Serve updates pushed to web_server (by Telegram, or by the shard
+    front-end when set_webhook is False) until SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
 
-    # Start quiz cleanup task in a separate thread
-    def start_cleanup_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(cleanup_old_quizzes())
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    try:
+        if set_webhook:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            print(f"✅ Webhook set to {WEBHOOK_URL}{WEBHOOK_PATH}")
+        await stop_event.wait()
+    finally:
+        await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+def main():
+    if SHARD_COUNT > 1 and SHARD_ROLE != "worker":
+        print(f"🧩 Starting shard front-end for {SHARD_COUNT} workers...")
+        asyncio.run(shard_front.run())
+        return
     
-    cleanup_thread = threading.Thread(target=start_cleanup_task, daemon=True)
-    cleanup_thread.start()
+    # Create the Application
+    application = build_application()
 
     print("🤖 Starting PlayPal Ultimate Bot...")
     print(f"✅ Admin IDs: {ADMIN_IDS}")
@@ -977,16 +3523,15 @@ def main():
     print("💰 Economy: Coins, XP, Levels, Referrals")
     print("✅ Bot is ready and waiting for messages...")
     
-    # Start polling
-    application.run_polling()
+    if SHARD_ROLE == "worker":
+        print(f"🧩 Shard {SHARD_INDEX}/{SHARD_COUNT} listening on port {PORT}")
+        asyncio.run(run_webhook(application, set_webhook=False))
+    elif BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        # Polling is kept for local development
+        application.run_polling()
 
 if __name__ == "__main__":
-    # Start Flask server for Railway
-    port = int(os.getenv("PORT", 5000))
-    threading.Thread(
-        target=lambda: app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False), 
-        daemon=True
-    ).start()
-    
     # Start the bot
     main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# benchmarks/bench_routing.py
+# Micro-benchmark for handle_message routing: per-message cost of the
+# Aho-Corasick intent matcher vs. the old chain of any(word in text.lower())
+# scans, as the number of registered intents grows.
+#
+# Usage: python benchmarks/bench_routing.py [--messages 20000]
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+BASE_INTENTS = [
+    ["@admin"],
+    ["hello", "hi", "hey", "hola"],
+    ["how are you", "how you doing"],
+    ["thank", "thanks", "thank you"],
+    ["joke", "funny"],
+    ["what can you do", "features"],
+    ["admin", "help", "support"],
+    ["channel", "group", "community"],
+]
+
+SAMPLE_MESSAGES = [
+    "lol that was a good round",
+    "anyone up for a quiz tonight?",
+    "Thanks for the coins!",
+    "what can you do",
+    "I need some support with my balance",
+    "ok",
+    "gg everyone, see you tomorrow in the group",
+    "🎮 Games",
+    "when is the next event happening?",
+    "hahaha this meme is gold",
+]
+
+def synthetic_intents(count, rng):
+    # Keywords that never occur in the sample messages, so every intent is scanned
+    return [
+        ["zq" + "".join(rng.choice(string.ascii_lowercase) for _ in range(6)) for _ in range(3)]
+        for _ in range(count)
+    ]
+
+def naive_router(intents):
+    def route(text):
+        for priority, words in enumerate(intents):
+            if any(word in text.lower() for word in words):
+                return priority
+        return None
+    return route
+
+def matcher_router(intents):
+    matcher = app.KeywordMatcher()
+    for priority, words in enumerate(intents):
+        for word in words:
+            matcher.add(word.lower(), priority)
+    def route(text):
+        return matcher.match(text.lower())
+    return route
+
+def time_per_message(route, messages):
+    started = time.perf_counter()
+    for text in messages:
+        route(text)
+    return (time.perf_counter() - started) / len(messages) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark handle_message intent routing")
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(args.messages)]
+
+    print(f"{'intents':>8} {'any() chain':>14} {'automaton':>12}")
+    for extra in (0, 10, 50, 200, 1000):
+        intents = BASE_INTENTS + synthetic_intents(extra, rng)
+        naive = time_per_message(naive_router(intents), messages)
+        automaton = time_per_message(matcher_router(intents), messages)
+        print(f"{len(intents):>8} {naive:>11.0f} ns {automaton:>9.0f} ns")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_trivia_loader.py
+# Startup cost of the trivia bank: time to index a JSONL file of synthetic
+# questions, heap memory the index keeps, and per-draw cost of the
+# non-repeating per-user cursor.
+#
+# Usage: python benchmarks/bench_trivia_loader.py [--questions 100000] [--draws 100000]
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+DIFFICULTIES = ["easy", "medium", "hard"]
+CATEGORIES = ["science", "geography", "history", "tech", "sports", "general"]
+
+def write_bank(path, count, rng):
+    with open(path, "w") as f:
+        for i in range(count):
+            answer = rng.randrange(4)
+            f.write(json.dumps({
+                "question": f"Synthetic question number {i}: which option is marked correct?",
+                "options": [f"Option {j}{' (correct)' if j == answer else ''}" for j in range(4)],
+                "answer": answer,
+                "difficulty": rng.choice(DIFFICULTIES),
+                "category": rng.choice(CATEGORIES),
+            }) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trivia bank loading and draws")
+    parser.add_argument("--questions", type=int, default=100_000)
+    parser.add_argument("--draws", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trivia.jsonl")
+        write_bank(path, args.questions, rng)
+        size = os.path.getsize(path)
+
+        bank = app.TriviaBank()
+        started = time.perf_counter()
+        bank.load(path)
+        elapsed = time.perf_counter() - started
+        bank.close()
+
+        # Second load under tracemalloc, which would otherwise skew the timing
+        bank = app.TriviaBank()
+        gc.collect()
+        tracemalloc.start()
+        bank.load(path)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        cursors = {}
+        started = time.perf_counter()
+        for i in range(args.draws):
+            bank.draw(cursors, DIFFICULTIES[i % 3] if i % 2 else None)
+        per_draw = (time.perf_counter() - started) / args.draws * 1e6
+        bank.close()
+
+    print(f"questions:      {args.questions}")
+    print(f"file size:      {size / 1e6:.1f} MB (mmap'd, not on the heap)")
+    print(f"load time:      {elapsed:.2f} s")
+    print(f"index memory:   {current / 1e6:.2f} MB retained, {peak / 1e6:.2f} MB peak"
+          f" ({current / args.questions:.0f} B/question)")
+    print(f"draw:           {per_draw:.1f} µs (decode included)")
+
+if __name__ == "__main__":
+    main()
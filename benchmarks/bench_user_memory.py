@@ -0,0 +1,72 @@
+# benchmarks/bench_user_memory.py
+# Memory per cached user: the original 20-key dict records (with two datetime
+# objects and a stored referral_code) vs. the slotted UserRecord.
+#
+# Usage: python benchmarks/bench_user_memory.py [--users 100000 1000000]
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+FIRST_USER_ID = 5_000_000_000  # realistic Telegram ids are well past the small-int cache
+
+def dict_record(user_id):
+    # The record layout ensure_user_record used before UserRecord
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "first_name": "Player",
+        "is_premium": False,
+        "is_admin": False,
+        "messages": 0,
+        "xp": 0,
+        "coins": 100,
+        "level": 1,
+        "language": "en",
+        "joined_at": datetime.now(timezone.utc),
+        "last_seen": datetime.now(timezone.utc),
+        "games_played": 0,
+        "referrals": 0,
+        "referral_code": f"ref_{user_id}",
+        "referred_by": None,
+        "has_joined_channel": False,
+        "has_joined_group": False,
+    }
+
+def slotted_record(user_id):
+    return app.UserRecord(user_id, f"user{user_id}", "Player")
+
+def bytes_per_user(factory, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    users = {}
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + count):
+        users[user_id] = factory(user_id)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del users
+    return total / count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory per cached user record")
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'dict':>12} {'UserRecord':>12} {'saved':>8}")
+    for count in args.users:
+        before = bytes_per_user(dict_record, count)
+        after = bytes_per_user(slotted_record, count)
+        print(f"{count:>10} {before:>8.0f} B/u {after:>8.0f} B/u {1 - after / before:>7.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# benchmarks/loadtest.py
+# Offline load test: builds the real Application (same handlers as main())
+# on a fake Bot API backend and replays a synthetic mix of updates (menu
+# presses, free text, /slots, /quiz and its button answers, referral /start)
+# through application.process_update. Reports updates/sec, p50/p99 latency
+# and memory growth for each simulated user count.
+#
+# Each user count runs in a fresh subprocess so memory numbers don't bleed.
+#
+# Usage: python benchmarks/loadtest.py [--users 10000 100000 1000000]
+#            [--updates 20000] [--concurrency 64] [--api-latency 0]
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ["STORE_BACKEND"] = "memory"
+os.environ["BOT_MODE"] = "polling"
+# Measure the bot itself, not Telegram's flood limits that outbound_limiter enforces
+os.environ.setdefault("SEND_RATE", "1000000")
+os.environ.setdefault("SEND_RATE_PRIVATE", "1000000")
+os.environ.setdefault("SEND_RATE_GROUP", "60000000")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+import app  # noqa: E402
+
+FIRST_USER_ID = 5_000_000_000
+BOT_ID = 1
+
+# (kind, weight): roughly what the bot sees in production
+MIX = [
+    ("menu", 30),
+    ("text", 30),
+    ("slots", 15),
+    ("quiz", 10),
+    ("quiz_answer", 10),
+    ("referral_start", 5),
+]
+MENU_BUTTONS = ["🎮 Games", "😂 Fun", "📊 Profile", "📰 Daily Fact", "💬 Quote", "🎯 Quiz", "⬅️ Back"]
+FREE_TEXT = ["hello there", "thanks!", "tell me a joke", "what can you do", "lol", "gg", "how are you"]
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+class FakeBotAPI(BaseRequest):
+    """Answers every Bot API call locally with a plausible result"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.message_ids = iter(range(1, 1 << 62))
+        self.calls = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "PlayPal", "username": "playpal_bot"}
+        elif api_method == "answerCallbackQuery":
+            result = True
+        else:
+            chat_id = params.get("chat_id", 0)
+            result = {
+                "message_id": params.get("message_id") or next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "PlayPal"},
+                "text": params.get("text", ""),
+            }
+            if api_method == "sendPhoto":
+                result["photo"] = [{"file_id": f"photo{result['message_id']}", "file_unique_id": "u", "width": 1, "height": 1}]
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+class UpdateFactory:
+    def __init__(self, users, rng):
+        self.users = users
+        self.rng = rng
+        self.update_ids = iter(range(1, 1 << 62))
+        self.open_quizzes = []  # users sent a /quiz, answered by a later quiz_answer
+        self.kinds = [kind for kind, _ in MIX]
+        self.weights = [weight for _, weight in MIX]
+
+    def user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": "Player", "username": f"user{user_id}"}
+
+    def message(self, user_id, text):
+        data = {
+            "message_id": next(self.update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self.user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self.update_ids), "message": data}
+
+    def callback(self, user_id, data, message_id):
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)),
+                "from": self.user(user_id),
+                "chat_instance": "loadtest",
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "PlayPal"},
+                    "text": "quiz",
+                },
+            },
+        }
+
+    def next(self):
+        """Built just before it is processed, so quiz answers can press a live quiz's buttons"""
+        user_id = FIRST_USER_ID + self.rng.randrange(self.users)
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "quiz_answer" and self.open_quizzes:
+            i = self.rng.randrange(len(self.open_quizzes))
+            self.open_quizzes[i], self.open_quizzes[-1] = self.open_quizzes[-1], self.open_quizzes[i]
+            user_id = self.open_quizzes.pop()
+        if kind == "menu":
+            return kind, self.message(user_id, self.rng.choice(MENU_BUTTONS))
+        if kind == "text":
+            return kind, self.message(user_id, self.rng.choice(FREE_TEXT))
+        if kind == "slots":
+            return kind, self.message(user_id, f"/slots {self.rng.randint(1, 10)}")
+        if kind == "quiz_answer":
+            game = app._active_games.get(f"{user_id}_{user_id}")
+            if game is not None:
+                choice = self.rng.randrange(len(game["question"]["options"]))
+                return kind, self.callback(user_id, f"q:{game['token']}:{choice}", game["message_id"] or 0)
+            kind = "quiz"
+        if kind == "quiz":
+            self.open_quizzes.append(user_id)
+            return kind, self.message(user_id, "/quiz")
+        referrer = FIRST_USER_ID + self.rng.randrange(self.users)
+        return kind, self.message(user_id, f"/start ref_{referrer}")
+
+def seed_users(count):
+    """Pre-populate the cache as if `count` users had already talked to the bot"""
+    for i in range(count):
+        user_id = FIRST_USER_ID + i
+        record = app.UserRecord(user_id, f"user{user_id}", "Player")
+        app._users[user_id] = record
+        app.register_user(record)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+async def run(users, updates, concurrency, api_latency, seed):
+    rng = random.Random(seed)
+    baseline = rss_mb()
+    seed_users(users)
+    gc.collect()
+    seeded = rss_mb()
+
+    fake = FakeBotAPI(api_latency)
+    application = app.build_application(request=fake)
+    await application.initialize()
+    app.bot_identity.resolve(application.bot)
+    app.trivia_bank.load(app.TRIVIA_BANK_PATH)
+    app.game_expiry.start(application.bot)
+
+    factory = UpdateFactory(users, rng)
+    latencies = {kind: [] for kind, _ in MIX}
+    remaining = iter(range(updates))
+
+    async def worker():
+        for _ in remaining:
+            kind, data = factory.next()
+            update = Update.de_json(data, application.bot)
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    after = rss_mb()
+
+    await app.game_expiry.stop()
+    await application.shutdown()
+    app.trivia_bank.close()
+
+    overall = sorted(t for values in latencies.values() for t in values)
+    return {
+        "users": users,
+        "updates": updates,
+        "updates_per_sec": updates / elapsed,
+        "p50_ms": percentile(overall, 0.50) * 1e3,
+        "p99_ms": percentile(overall, 0.99) * 1e3,
+        "api_calls": fake.calls,
+        "errors": sum(app.errors_total.values.values()),
+        "seed_mb": seeded - baseline,
+        "run_mb": after - seeded,
+        "per_kind": {
+            kind: (len(values), percentile(sorted(values), 0.99) * 1e3)
+            for kind, values in latencies.items() if values
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic updates through the bot's handlers")
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64, help="updates in flight at once")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every fake Bot API call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)  # child-process mode
+    args = parser.parse_args()
+
+    if args.json:
+        result = asyncio.run(run(args.users[0], args.updates, args.concurrency, args.api_latency, args.seed))
+        print("LOADTEST " + json.dumps(result))
+        return
+
+    print(f"{'users':>9} {'upd/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'seed MB':>8} {'run MB':>8} {'errors':>7}")
+    for users in args.users:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--json", "--users", str(users),
+             "--updates", str(args.updates), "--concurrency", str(args.concurrency),
+             "--api-latency", str(args.api_latency), "--seed", str(args.seed)],
+            capture_output=True, text=True,
+        )
+        line = next((l for l in child.stdout.splitlines() if l.startswith("LOADTEST ")), None)
+        if line is None:
+            print(f"{users:>9} failed:\n{child.stdout}{child.stderr}")
+            continue
+        r = json.loads(line[len("LOADTEST "):])
+        print(f"{users:>9} {r['updates_per_sec']:>8.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+              f" {r['seed_mb']:>8.1f} {r['run_mb']:>8.1f} {r['errors']:>7}")
+        for kind, (count, p99) in r["per_kind"].items():
+            print(f"{'':>9}   {kind:<15} {count:>6} updates, p99 {p99:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# slots.py
+# Payout-table driven slot machine for PlayPal, plus an exact RTP calculator
+# and a NumPy-batched Monte-Carlo simulator for tuning tables before deploy.
+#
+# Usage: python slots.py [table.json] [--spins 10000000] [--seed 42] [--max-rtp 1.0]
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+# The rules /slots has always used: three reels drawing uniformly from seven
+# symbols; three of a kind pays 10x for diamonds, 5x for sevens and 3x for
+# anything else, otherwise two matching adjacent reels pay 1.5x.
+DEFAULT_PAYOUT_TABLE = {
+    "symbols": {"🍒": 1, "🍋": 1, "🍊": 1, "🍇": 1, "🔔": 1, "💎": 1, "7️⃣": 1},  # reel weights
+    "three_of_a_kind": {"💎": 10, "7️⃣": 5, "*": 3},  # "*" covers every other symbol
+    "adjacent_pair": 1.5,
+}
+
+REELS = 3
+
+def validate_table(table):
+    """Raise ValueError describing the first problem in a payout table"""
+    symbols = table.get("symbols")
+    if not isinstance(symbols, dict) or not symbols:
+        raise ValueError("'symbols' must be a non-empty object of symbol -> weight")
+    for symbol, weight in symbols.items():
+        if not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError(f"weight for {symbol} must be a positive number")
+    triples = table.get("three_of_a_kind", {})
+    if not isinstance(triples, dict):
+        raise ValueError("'three_of_a_kind' must be an object of symbol -> multiplier")
+    for symbol, multiplier in triples.items():
+        if symbol != "*" and symbol not in symbols:
+            raise ValueError(f"three_of_a_kind pays on unknown symbol {symbol}")
+        if not isinstance(multiplier, (int, float)) or multiplier < 0:
+            raise ValueError(f"multiplier for {symbol} must be a non-negative number")
+    pair = table.get("adjacent_pair", 0)
+    if not isinstance(pair, (int, float)) or pair < 0:
+        raise ValueError("'adjacent_pair' must be a non-negative number")
+    return table
+
+def load_table(path):
+    with open(path, encoding="utf-8") as f:
+        return validate_table(json.load(f))
+
+class SlotMachine:
+    """Spins and pays out according to a payout table"""
+    def __init__(self, table=DEFAULT_PAYOUT_TABLE):
+        validate_table(table)
+        self.table = table
+        self.symbols = list(table["symbols"])
+        self.weights = [table["symbols"][s] for s in self.symbols]
+        triples = table.get("three_of_a_kind", {})
+        self.triple_pays = {s: triples.get(s, triples.get("*", 0)) for s in self.symbols}
+        self.pair_pays = table.get("adjacent_pair", 0)
+
+    def multiplier(self, result):
+        if result[0] == result[1] == result[2]:
+            return self.triple_pays[result[0]]
+        if result[0] == result[1] or result[1] == result[2]:
+            return self.pair_pays
+        return 0
+
+    def spin(self):
+        result = random.choices(self.symbols, weights=self.weights, k=REELS)
+        return result, self.multiplier(result)
+
+    def exact_stats(self):
+        """RTP, variance and hit frequency (per unit bet) by enumerating every outcome"""
+        total = sum(self.weights)
+        probs = [w / total for w in self.weights]
+        n = len(self.symbols)
+        mean = second = hits = 0.0
+        for i in range(n):
+            for j in range(n):
+                for k in range(n):
+                    p = probs[i] * probs[j] * probs[k]
+                    m = self.multiplier((self.symbols[i], self.symbols[j], self.symbols[k]))
+                    mean += p * m
+                    second += p * m * m
+                    if m > 0:
+                        hits += p
+        return {"rtp": mean, "variance": second - mean * mean, "hit_frequency": hits}
+
+    def simulate(self, spins, seed=None, batch=1_000_000):
+        """Monte-Carlo estimate of the same numbers, vectorized in batches with NumPy"""
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("the slots simulator needs numpy (pip install numpy)") from None
+
+        rng = np.random.default_rng(seed)
+        cumulative = np.cumsum(self.weights, dtype=np.float64)
+        cumulative /= cumulative[-1]
+        triple_pays = np.array([self.triple_pays[s] for s in self.symbols], dtype=np.float64)
+
+        total = total_sq = hits = 0.0
+        done = 0
+        started = time.perf_counter()
+        while done < spins:
+            size = min(batch, spins - done)
+            reels = np.searchsorted(cumulative, rng.random((REELS, size)), side="right")
+            first_pair = reels[0] == reels[1]
+            second_pair = reels[1] == reels[2]
+            triple = first_pair & second_pair
+            pays = np.where(triple, triple_pays[reels[0]], np.where(first_pair | second_pair, self.pair_pays, 0.0))
+            total += pays.sum()
+            total_sq += np.square(pays).sum()
+            hits += np.count_nonzero(pays)
+            done += size
+        elapsed = time.perf_counter() - started
+
+        mean = total / spins
+        return {
+            "rtp": mean,
+            "variance": total_sq / spins - mean * mean,
+            "hit_frequency": hits / spins,
+            "spins_per_second": spins / elapsed if elapsed else math.inf,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a slots payout table and report its economics")
+    parser.add_argument("table", nargs="?", help="JSON payout table (default: the built-in table)")
+    parser.add_argument("--spins", type=int, default=10_000_000, help="Monte-Carlo spins, 0 to skip")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-rtp", type=float, default=1.0, help="fail if the exact RTP exceeds this")
+    args = parser.parse_args()
+
+    try:
+        machine = SlotMachine(load_table(args.table) if args.table else DEFAULT_PAYOUT_TABLE)
+    except (OSError, ValueError) as e:
+        print(f"❌ Invalid payout table: {e}")
+        return 1
+
+    exact = machine.exact_stats()
+    print(f"{'':<20} {'exact':>10}", end="")
+    print(f" {'simulated':>10}" if args.spins else "")
+    simulated = machine.simulate(args.spins, args.seed) if args.spins else None
+    for key, label in (("rtp", "RTP"), ("variance", "variance"), ("hit_frequency", "hit frequency")):
+        print(f"{label:<20} {exact[key]:>10.4f}", end="")
+        print(f" {simulated[key]:>10.4f}" if simulated else "")
+    print(f"{'house edge':<20} {1 - exact['rtp']:>10.2%}")
+    if simulated:
+        print(f"{'spins/sec':<20} {'':>10} {simulated['spins_per_second']:>10,.0f}")
+    print("Payouts are per unit bet; /slots rounds winnings down to whole coins.")
+
+    if exact["rtp"] > args.max_rtp:
+        print(f"❌ RTP {exact['rtp']:.4f} exceeds --max-rtp {args.max_rtp}")
+        return 1
+    print("✅ Table OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())